@@ -41,6 +41,34 @@ def calculate_iou(
     return intersection / union
 
 
+def calculate_iou_pairs(
+    boxes1: np.ndarray,
+    boxes2: np.ndarray
+) -> np.ndarray:
+    """Calculate IoU element-wise for two aligned arrays of bounding boxes.
+    
+    Args:
+        boxes1: Array of shape (N, 4) with boxes [x1, y1, x2, y2].
+        boxes2: Array of shape (N, 4) with boxes [x1, y1, x2, y2].
+        
+    Returns:
+        Array of shape (N,) with the IoU of each box pair.
+    """
+    inter_width = np.clip(
+        np.minimum(boxes1[:, 2], boxes2[:, 2]) - np.maximum(boxes1[:, 0], boxes2[:, 0]), 0, None
+    )
+    inter_height = np.clip(
+        np.minimum(boxes1[:, 3], boxes2[:, 3]) - np.maximum(boxes1[:, 1], boxes2[:, 1]), 0, None
+    )
+    intersection = inter_width * inter_height
+    
+    box1_area = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    box2_area = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    union = box1_area + box2_area - intersection
+    
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union != 0)
+
+
 def calculate_average_precision(
     recalls: np.ndarray,
     precisions: np.ndarray
@@ -177,6 +205,71 @@ def calculate_map(
     return float(np.mean(aps))
 
 
+def calculate_map_arrays(
+    predictions: np.ndarray,
+    ground_truths: np.ndarray,
+    iou_threshold: float = 0.5,
+    num_classes: Optional[int] = None
+) -> float:
+    """Calculate mean Average Precision (mAP) from flat detection arrays.
+    
+    Vectorized equivalent of ``calculate_map`` for columnar inputs, one row
+    per box across the whole dataset.
+    
+    Args:
+        predictions: Array of shape (N, 7) with rows
+            [image_idx, x1, y1, x2, y2, score, label].
+        ground_truths: Array of shape (M, 6) with rows
+            [image_idx, x1, y1, x2, y2, label].
+        iou_threshold: IoU threshold for matching.
+        num_classes: Number of classes (if None, inferred from data).
+        
+    Returns:
+        mAP score.
+    """
+    predictions = np.asarray(predictions, dtype=np.float32).reshape(-1, 7)
+    ground_truths = np.asarray(ground_truths, dtype=np.float32).reshape(-1, 6)
+    
+    if num_classes is None:
+        num_classes = len(np.unique(ground_truths[:, 5]))
+    
+    aps = []
+    
+    for class_id in range(num_classes):
+        class_gts = ground_truths[ground_truths[:, 5] == class_id]
+        if len(class_gts) == 0:
+            continue
+        
+        class_preds = predictions[predictions[:, 6] == class_id]
+        class_preds = class_preds[np.argsort(-class_preds[:, 5], kind='stable')]
+        
+        # Pair every detection with each ground truth box of the same image
+        class_gts = class_gts[np.argsort(class_gts[:, 0], kind='stable')]
+        starts = np.searchsorted(class_gts[:, 0], class_preds[:, 0], side='left')
+        ends = np.searchsorted(class_gts[:, 0], class_preds[:, 0], side='right')
+        counts = ends - starts
+        
+        pred_idx = np.repeat(np.arange(len(class_preds)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        gt_idx = np.repeat(starts, counts) + offsets
+        
+        hits = calculate_iou_pairs(class_preds[pred_idx, 1:5], class_gts[gt_idx, 1:5]) >= iou_threshold
+        matched = np.bincount(pred_idx[hits], minlength=len(class_preds)) > 0
+        
+        true_positives = np.cumsum(matched)
+        false_positives = np.cumsum(~matched)
+        
+        precisions = true_positives / (true_positives + false_positives + 1e-10)
+        recalls = true_positives / (len(class_gts) + 1e-10)
+        
+        aps.append(calculate_average_precision(recalls, precisions))
+    
+    if not aps:
+        return 0.0
+    
+    return float(np.mean(aps))
+
+
 def calculate_auroc(
     y_true: np.ndarray,
     y_scores: np.ndarray,
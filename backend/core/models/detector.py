@@ -110,9 +110,11 @@ class DefectDetector(BaseDetector):
         """
         checkpoint = torch.load(model_path, map_location=self.device)
         if isinstance(checkpoint, dict) and 'model_state_dict' in checkpoint:
-            self.model.load_state_dict(checkpoint['model_state_dict'])
-        else:
-            self.model.load_state_dict(checkpoint)
+            checkpoint = checkpoint['model_state_dict']
+        # Weights saved from a torch.compile'd submodule carry an "_orig_mod." prefix
+        self.model.load_state_dict(
+            {key.replace('_orig_mod.', ''): value for key, value in checkpoint.items()}
+        )
     
     def preprocess_image(self, image: np.ndarray) -> torch.Tensor:
         """Preprocess image for model input.
@@ -168,6 +170,43 @@ class DefectDetector(BaseDetector):
             'labels': labels.tolist()
         }
     
+    def predict_batch(
+        self,
+        images: torch.Tensor,
+        confidence_threshold: float = 0.0
+    ) -> List[List[Dict[str, Any]]]:
+        """Detect defects in a batch of images with a single forward pass.
+        
+        Args:
+            images: Preprocessed image batch (B, C, H, W) or list of (C, H, W) tensors.
+            confidence_threshold: Minimum confidence score for detections.
+            
+        Returns:
+            One list of detections per image, each detection a dictionary with keys:
+                - box: Bounding box [x1, y1, x2, y2]
+                - score: Confidence score
+                - label: 'defect'
+                - class_id: Predicted class ID
+        """
+        images = [image.to(self.device, non_blocking=True) for image in images]
+        
+        with torch.no_grad():
+            outputs = self.model(images)
+        
+        batch_detections = []
+        for output in outputs:
+            mask = output['scores'] >= confidence_threshold
+            boxes = output['boxes'][mask].cpu().tolist()
+            scores = output['scores'][mask].cpu().tolist()
+            labels = output['labels'][mask].cpu().tolist()
+            
+            batch_detections.append([
+                {'box': box, 'score': score, 'label': 'defect', 'class_id': class_id}
+                for box, score, class_id in zip(boxes, scores, labels)
+            ])
+        
+        return batch_detections
+    
     def segment(
         self,
         image: np.ndarray,
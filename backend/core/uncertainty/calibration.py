@@ -162,7 +162,7 @@ class TemperatureScaling(nn.Module):
         optimizer = optim.LBFGS([self.temperature], lr=lr, max_iter=max_iter)
         
         def eval_loss():
-            optimizer.zero_grad()
+            optimizer.zero_grad(set_to_none=True)
             loss = nll_criterion(self.forward(logits), labels)
             loss.backward()
             return loss
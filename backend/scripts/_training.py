@@ -0,0 +1,154 @@
+"""
+Shared helpers for the ultralytics training scripts.
+
+Dataset config loading, dataloader/memory-format tuning, multi-GPU setup,
+image cache selection and slim periodic checkpoints, used by
+train_minor_defect_focused.py, train_two_stage_detector.py,
+train_offline.py and start_training.py.
+"""
+
+import os
+import functools
+from datetime import datetime
+from pathlib import Path
+
+import torch
+import yaml
+
+try:
+    # LibYAML C bindings parse/emit ~10x faster than the pure-Python versions
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+@functools.lru_cache(maxsize=None)
+def load_yaml(path: str) -> dict:
+    """Parse a YAML file once per process (callers must not mutate the result)"""
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def patch_dataloaders():
+    """Persistent workers, deeper prefetch and pinned memory for ultralytics dataloaders"""
+    import ultralytics.data.build as build
+    
+    if getattr(build.InfiniteDataLoader, '_radikal_patched', False):
+        return
+    
+    original_init = build.InfiniteDataLoader.__init__
+    def patched_init(self, *args, **kwargs):
+        kwargs['pin_memory'] = torch.cuda.is_available()
+        if kwargs.get('num_workers', 0) > 0:
+            kwargs['persistent_workers'] = True
+            kwargs['prefetch_factor'] = 4
+        original_init(self, *args, **kwargs)
+    
+    build.InfiniteDataLoader.__init__ = patched_init
+    build.InfiniteDataLoader._radikal_patched = True
+
+
+def to_channels_last(trainer):
+    """Switch the trainer's network and its input batches to channels-last (NHWC)"""
+    trainer.model.to(memory_format=torch.channels_last)
+    
+    preprocess_batch = trainer.preprocess_batch
+    def preprocess_channels_last(batch):
+        batch = preprocess_batch(batch)
+        batch['img'] = batch['img'].contiguous(memory_format=torch.channels_last)
+        return batch
+    trainer.preprocess_batch = preprocess_channels_last
+
+
+def parse_devices(device: str):
+    """
+    Parse a --device value: '0' or 'cpu' is passed through, while a comma
+    list such as '0,1' becomes [0, 1] so ultralytics launches DDP.
+    
+    Returns:
+        (device for model.train, number of GPUs used for data parallelism)
+    """
+    if ',' in device:
+        devices = [int(x) for x in device.split(',') if x.strip()]
+        return devices, len(devices)
+    return device, 1
+
+
+def patched_trainer(model, sync_bn: bool = False, patches=()):
+    """
+    Trainer class for model's task that applies patch_dataloaders() and each
+    of patches (callables) in the process that actually trains.
+    
+    Multi-GPU runs train in torch.distributed workers that rebuild the
+    trainer from its pickled class, so monkeypatches applied in this process
+    never reach them; the class (pickled by value, patches included) does.
+    sync_bn converts BatchNorm to SyncBatchNorm.
+    """
+    base = model.task_map[model.task]['trainer']
+    
+    class PatchedTrainer(base):
+        def get_model(self, *args, **kwargs):
+            net = super().get_model(*args, **kwargs)
+            return torch.nn.SyncBatchNorm.convert_sync_batchnorm(net) if sync_bn else net
+        
+        def get_dataloader(self, *args, **kwargs):
+            # First thing in _setup_train that builds anything patched (the
+            # loss itself is built lazily on the first training step)
+            patch_dataloaders()
+            for patch in patches:
+                patch()
+            return super().get_dataloader(*args, **kwargs)
+    
+    return PatchedTrainer
+
+
+def choose_cache_mode(data_yaml: str, imgsz: int = 640, headroom: float = 1.3):
+    """Cache decoded images in RAM if they fit with headroom, else on disk (.npy)"""
+    import psutil
+    
+    config = load_yaml(str(data_yaml))
+    
+    root = Path(config.get('path', Path(data_yaml).parent))
+    num_images = 0
+    for split in ('train', 'val'):
+        if split in config:
+            for _, _, files in os.walk(root / config[split]):
+                num_images += sum(name.lower().endswith(IMAGE_SUFFIXES) for name in files)
+    
+    needed = num_images * imgsz * imgsz * 3
+    return 'ram' if psutil.virtual_memory().available > needed * headroom else 'disk'
+
+
+def save_slim_checkpoints(model):
+    """
+    Write the periodic epochN.pt checkpoints as FP16 EMA weights only.
+    
+    ultralytics stores the full training state (optimizer included) for
+    every save_period snapshot; last.pt/best.pt keep that state for resuming,
+    so the periodic snapshots only need the weights.
+    """
+    from copy import deepcopy
+    
+    def take_over_periodic_saves(trainer):
+        trainer.slim_save_period, trainer.save_period = trainer.save_period, -1
+    
+    def save_slim(trainer):
+        period = trainer.slim_save_period
+        if period > 0 and trainer.epoch % period == 0:
+            # NCHW like ultralytics' own checkpoints, without the loss criterion
+            ema = deepcopy(trainer.ema.ema).half().to(memory_format=torch.contiguous_format)
+            ema.criterion = None
+            torch.save({
+                'epoch': trainer.epoch,
+                'best_fitness': trainer.best_fitness,
+                'model': None,
+                'ema': ema,
+                'updates': trainer.ema.updates,
+                'train_args': vars(trainer.args),
+                'date': datetime.now().isoformat(),
+            }, trainer.wdir / f"epoch{trainer.epoch}.pt")
+    
+    model.add_callback('on_pretrain_routine_end', take_over_periodic_saves)
+    model.add_callback('on_model_save', save_slim)
@@ -0,0 +1,41 @@
+"""
+Shared cache of pre-trained YOLOv8 weights for the training scripts.
+
+Weights live in ~/.cache (where start_training.py and train_offline.py
+already expect them) and are downloaded at most once, so later runs and
+offline runs never hit the network.
+"""
+
+import os
+import shutil
+import urllib.request
+from pathlib import Path
+
+WEIGHTS_URL = 'https://github.com/ultralytics/assets/releases/download/v8.3.0/{name}'
+CACHE_DIR = Path(os.path.expanduser('~/.cache'))
+
+
+def weights_path(model_size: str = 's', suffix: str = '') -> str:
+    """
+    Return the cached yolov8{model_size}{suffix}.pt, downloading it once if missing.
+    
+    Args:
+        model_size: 'n', 's', 'm', 'l', 'x'
+        suffix: Task suffix, e.g. '-cls' for classification weights
+    """
+    name = f'yolov8{model_size}{suffix}.pt'
+    path = CACHE_DIR / name
+    if path.is_file():
+        return str(path)
+    
+    print(f"📥 Downloading pre-trained weights: {name}")
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Download next to the target and rename, so an interrupted download
+    # never leaves a truncated .pt in the cache
+    tmp_path = path.with_name(name + '.tmp')
+    with urllib.request.urlopen(WEIGHTS_URL.format(name=name), timeout=30) as response, \
+            open(tmp_path, 'wb') as f:
+        shutil.copyfileobj(response, f, 1 << 20)
+    os.replace(tmp_path, path)
+    print(f"✅ Saved to {path}")
+    return str(path)
@@ -11,24 +11,16 @@ Run this script to add the required tables for new features:
 Usage: python backend/scripts/add_feature_tables.py
 """
 
+import hashlib
 import sqlite3
 import os
 from datetime import datetime
 
 DB_PATH = "backend/data/radikal.db"
 
-def create_tables():
-    """Create all required tables for new features."""
-    
-    print(f"📊 Connecting to database: {DB_PATH}")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    print("\n🔨 Creating tables...")
-    
-    # 1. Reviews Table
-    print("  ✓ Creating 'reviews' table...")
-    cursor.execute("""
+# Feature tables (name, DDL)
+TABLES = [
+    ("reviews", """
         CREATE TABLE IF NOT EXISTS reviews (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             analysis_id TEXT NOT NULL,
@@ -39,11 +31,8 @@ def create_tables():
             updated_at TEXT NOT NULL,
             FOREIGN KEY (analysis_id) REFERENCES analysis_history(id)
         )
-    """)
-    
-    # 2. Review Annotations Table
-    print("  ✓ Creating 'review_annotations' table...")
-    cursor.execute("""
+    """),
+    ("review_annotations", """
         CREATE TABLE IF NOT EXISTS review_annotations (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             review_id INTEGER NOT NULL,
@@ -56,11 +45,8 @@ def create_tables():
             created_at TEXT NOT NULL,
             FOREIGN KEY (review_id) REFERENCES reviews(id)
         )
-    """)
-    
-    # 3. Compliance Certificates Table
-    print("  ✓ Creating 'compliance_certificates' table...")
-    cursor.execute("""
+    """),
+    ("compliance_certificates", """
         CREATE TABLE IF NOT EXISTS compliance_certificates (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             analysis_id TEXT NOT NULL,
@@ -74,11 +60,8 @@ def create_tables():
             pdf_path TEXT,
             FOREIGN KEY (analysis_id) REFERENCES analysis_history(id)
         )
-    """)
-    
-    # 4. Operator Performance Table
-    print("  ✓ Creating 'operator_performance' table...")
-    cursor.execute("""
+    """),
+    ("operator_performance", """
         CREATE TABLE IF NOT EXISTS operator_performance (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             operator_id TEXT NOT NULL,
@@ -89,31 +72,67 @@ def create_tables():
             created_at TEXT NOT NULL,
             FOREIGN KEY (analysis_id) REFERENCES analysis_history(id)
         )
-    """)
-    
-    # Create indexes for better query performance
-    print("\n📇 Creating indexes...")
-    cursor.execute("""
+    """),
+]
+
+# Indexes for better query performance
+INDEXES = [
+    """
         CREATE INDEX IF NOT EXISTS idx_reviews_analysis_id 
         ON reviews(analysis_id)
-    """)
-    cursor.execute("""
+    """,
+    """
         CREATE INDEX IF NOT EXISTS idx_reviews_status 
         ON reviews(status)
-    """)
-    cursor.execute("""
+    """,
+    """
         CREATE INDEX IF NOT EXISTS idx_certificates_analysis_id 
         ON compliance_certificates(analysis_id)
-    """)
-    cursor.execute("""
+    """,
+    """
         CREATE INDEX IF NOT EXISTS idx_certificates_standard 
         ON compliance_certificates(standard)
-    """)
-    cursor.execute("""
+    """,
+    """
         CREATE INDEX IF NOT EXISTS idx_operator_performance_operator_id 
         ON operator_performance(operator_id)
-    """)
+    """,
+]
+
+# Hash of the full DDL; recorded in schema_version once the migration is applied
+SCHEMA_HASH = hashlib.sha256(
+    "".join([ddl for _, ddl in TABLES] + INDEXES).encode()
+).hexdigest()
+
+
+def create_tables():
+    """Create all required tables for new features.
+    
+    Returns:
+        True if the migration ran, False if the schema was already current.
+    """
+    
+    print(f"📊 Connecting to database: {DB_PATH}")
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    # Fast path: skip all DDL when this exact schema has already been applied
+    cursor.execute("CREATE TABLE IF NOT EXISTS schema_version (hash TEXT PRIMARY KEY)")
+    if cursor.execute("SELECT 1 FROM schema_version WHERE hash = ?", (SCHEMA_HASH,)).fetchone():
+        conn.close()
+        print(f"\n✅ Schema already up to date ({SCHEMA_HASH[:12]}), nothing to do.\n")
+        return False
+    
+    print("\n🔨 Creating tables...")
+    for table_name, ddl in TABLES:
+        print(f"  ✓ Creating '{table_name}' table...")
+        cursor.execute(ddl)
+    
+    print("\n📇 Creating indexes...")
+    for ddl in INDEXES:
+        cursor.execute(ddl)
     
+    cursor.execute("INSERT OR IGNORE INTO schema_version (hash) VALUES (?)", (SCHEMA_HASH,))
     conn.commit()
     print("\n✅ All tables created successfully!")
     
@@ -126,18 +145,14 @@ def create_tables():
     
     conn.close()
     print(f"\n✨ Migration complete! Database: {DB_PATH}\n")
+    return True
 
 def verify_tables():
     """Verify all tables were created."""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
-    required_tables = [
-        'reviews',
-        'review_annotations',
-        'compliance_certificates',
-        'operator_performance'
-    ]
+    required_tables = [table_name for table_name, _ in TABLES]
     
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
     existing_tables = [row[0] for row in cursor.fetchall()]
@@ -166,12 +181,11 @@ if __name__ == "__main__":
         exit(1)
     
     try:
-        create_tables()
-        
-        if verify_tables():
-            print("🎉 All tables verified successfully!\n")
-        else:
-            print("⚠️  Some tables are missing. Please check the logs.\n")
+        if create_tables():
+            if verify_tables():
+                print("🎉 All tables verified successfully!\n")
+            else:
+                print("⚠️  Some tables are missing. Please check the logs.\n")
             
     except Exception as e:
         print(f"\n❌ Error: {e}\n")
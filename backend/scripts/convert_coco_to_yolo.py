@@ -3,17 +3,21 @@ Convert COCO format to YOLO format for training
 """
 
 import json
+import logging
 import os
 from pathlib import Path
 from tqdm import tqdm
 
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
 def coco_to_yolo(data_dir="data"):
     """Convert COCO annotations to YOLO format"""
     
     data_path = Path(data_dir)
     
     for split in ['train', 'val', 'test']:
-        print(f"\n📋 Converting {split} annotations...")
+        logger.info(f"\n📋 Converting {split} annotations...")
         
         # Paths
         images_dir = data_path / split / 'images'
@@ -43,7 +47,8 @@ def coco_to_yolo(data_dir="data"):
         
         # Convert each image's annotations
         converted = 0
-        for image_id, img_info in tqdm(images.items(), desc=f"Converting {split}"):
+        for image_id, img_info in tqdm(images.items(), desc=f"Converting {split}",
+                                       miniters=256, mininterval=0.5, smoothing=0.1):
             img_width = img_info['width']
             img_height = img_info['height']
             img_filename = Path(img_info['file_name']).stem
@@ -73,7 +78,7 @@ def coco_to_yolo(data_dir="data"):
             
             converted += 1
         
-        print(f"✅ Converted {converted} images in {split} set")
+        logger.info(f"✅ Converted {converted} images in {split} set")
     
     print("\n🎉 Conversion complete!")
     print(f"\n📁 Dataset structure:")
@@ -27,15 +27,24 @@ Usage:
     python scripts/convert_radikal_dataset.py --input DATA --output backend/data
 """
 
+import errno
 import os
 import json
+import mmap
 import shutil
+import struct
+from collections import namedtuple
 from pathlib import Path
+import numpy as np
 from PIL import Image
 from tqdm import tqdm
 import argparse
+import logging
 from datetime import datetime
 
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
 
 # Class mapping for RIAWELC dataset
 CLASS_MAPPING = {
@@ -59,49 +68,97 @@ CLASS_DESCRIPTIONS = {
     3: 'Cracks (CR) - Structural cracks',
 }
 
+# Lightweight per-image record (tuple-backed, no per-instance dict)
+ImgInfo = namedtuple('ImgInfo', 'id file_name width height category_id original_path')
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _image_size(img_file):
+    """Return (width, height) of an image.
+    
+    PNGs are validated and sized from their signature + IHDR header through a
+    read-only mmap, without decoding pixel data. Other formats go through PIL.
+    """
+    if img_file.suffix.lower() == '.png':
+        with open(img_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:8] != PNG_SIGNATURE or mm[12:16] != b"IHDR":
+                raise ValueError("not a valid PNG file")
+            return struct.unpack(">II", mm[16:24])
+    
+    with Image.open(img_file) as img:
+        return img.size
+
+
+def _stage(src, dst):
+    """Place a source image into the output dataset.
+    
+    Hardlinks when source and destination share a filesystem; otherwise falls
+    back to a plain content copy (no stat/utime/chmod metadata replication).
+    Safe to re-run over an existing output dataset.
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        if os.path.samefile(src, dst):
+            return  # already linked by a previous run
+        # Stale entry from an earlier conversion: replace it
+        os.unlink(dst)
+        _stage(src, dst)
+    except OSError as e:
+        # Cross-device, or a filesystem that refuses hardlinks
+        if e.errno not in (errno.EXDEV, errno.EPERM):
+            raise
+        shutil.copyfile(src, dst)
+
 
 def create_coco_annotations(images_info, split_name):
     """
     Create COCO format annotations for classification task.
     For images with defects, we create a bounding box covering most of the image.
     """
-    annotations = []
-    annotation_id = 1
+    defect_imgs = [img for img in images_info if img.category_id > 0]
+    if not defect_imgs:
+        return []
     
-    for img_info in images_info:
-        if img_info['category_id'] > 0:  # Has defect
-            # Create a bounding box covering 80% of image (center region)
-            width, height = img_info['width'], img_info['height']
-            bbox_width = int(width * 0.8)
-            bbox_height = int(height * 0.8)
-            x = int((width - bbox_width) / 2)
-            y = int((height - bbox_height) / 2)
-            
-            annotations.append({
-                'id': annotation_id,
-                'image_id': img_info['id'],
-                'category_id': img_info['category_id'],
-                'bbox': [x, y, bbox_width, bbox_height],  # [x, y, width, height]
-                'area': bbox_width * bbox_height,
-                'iscrowd': 0,
-                'segmentation': [[
-                    x, y,
-                    x + bbox_width, y,
-                    x + bbox_width, y + bbox_height,
-                    x, y + bbox_height
-                ]]
-            })
-            annotation_id += 1
+    # Bounding box covering 80% of each image (center region), computed in bulk
+    n = len(defect_imgs)
+    widths = np.fromiter((img.width for img in defect_imgs), dtype=np.int32, count=n)
+    heights = np.fromiter((img.height for img in defect_imgs), dtype=np.int32, count=n)
+    bbox_widths = (widths * 0.8).astype(np.int32)
+    bbox_heights = (heights * 0.8).astype(np.int32)
+    xs = (widths - bbox_widths) // 2
+    ys = (heights - bbox_heights) // 2
+    areas = bbox_widths * bbox_heights
     
-    return annotations
+    return [
+        {
+            'id': annotation_id,
+            'image_id': img_info.id,
+            'category_id': img_info.category_id,
+            'bbox': [x, y, bbox_width, bbox_height],  # [x, y, width, height]
+            'area': area,
+            'iscrowd': 0,
+            'segmentation': [[
+                x, y,
+                x + bbox_width, y,
+                x + bbox_width, y + bbox_height,
+                x, y + bbox_height
+            ]]
+        }
+        for annotation_id, img_info, x, y, bbox_width, bbox_height, area in zip(
+            range(1, n + 1), defect_imgs,
+            xs.tolist(), ys.tolist(), bbox_widths.tolist(), bbox_heights.tolist(), areas.tolist()
+        )
+    ]
 
 
 def convert_split(input_dir, output_dir, split_name):
     """Convert one split (training/validation/testing) to backend format."""
     
-    print(f"\n{'='*60}")
-    print(f"Converting {split_name.upper()} split...")
-    print(f"{'='*60}")
+    logger.info(f"\n{'='*60}")
+    logger.info(f"Converting {split_name.upper()} split...")
+    logger.info(f"{'='*60}")
     
     # Create output directories
     split_map = {'training': 'train', 'validation': 'val', 'testing': 'test'}
@@ -115,6 +172,7 @@ def convert_split(input_dir, output_dir, split_name):
     # Collect all images
     images_info = []
     image_id = 1
+    new_filename_template = f"{output_split}_{{:06d}}.png"
     
     input_split_dir = input_dir / split_name
     
@@ -124,45 +182,46 @@ def convert_split(input_dir, output_dir, split_name):
         
         class_name = class_folder.name
         if class_name not in CLASS_MAPPING:
-            print(f"⚠️  Skipping unknown class: {class_name}")
+            logger.warning(f"⚠️  Skipping unknown class: {class_name}")
             continue
         
         category_id = CLASS_MAPPING[class_name]
-        print(f"\n📂 Processing {class_name} (category {category_id})...")
+        class_rel = class_folder.relative_to(input_dir)
+        logger.info(f"\n📂 Processing {class_name} (category {category_id})...")
         
         # Get all image files
         image_files = list(class_folder.glob('*.png')) + list(class_folder.glob('*.jpg'))
         
-        for img_file in tqdm(image_files, desc=f"  {class_name}"):
+        for img_file in tqdm(image_files, desc=f"  {class_name}",
+                             miniters=256, mininterval=0.5, smoothing=0.1):
             try:
-                # Open image to get dimensions
-                with Image.open(img_file) as img:
-                    width, height = img.size
+                # Read image dimensions (header only)
+                width, height = _image_size(img_file)
                 
                 # Create new filename
-                new_filename = f"{output_split}_{image_id:06d}.png"
+                new_filename = new_filename_template.format(image_id)
                 
-                # Copy image
-                shutil.copy2(img_file, images_dir / new_filename)
+                # Link or copy image
+                _stage(img_file, images_dir / new_filename)
                 
                 # Store image info
-                images_info.append({
-                    'id': image_id,
-                    'file_name': new_filename,
-                    'width': width,
-                    'height': height,
-                    'category_id': category_id,
-                    'original_path': str(img_file.relative_to(input_dir))
-                })
+                images_info.append(ImgInfo(
+                    id=image_id,
+                    file_name=new_filename,
+                    width=width,
+                    height=height,
+                    category_id=category_id,
+                    original_path=str(class_rel / img_file.name)
+                ))
                 
                 image_id += 1
                 
             except Exception as e:
-                print(f"⚠️  Error processing {img_file.name}: {e}")
+                logger.warning(f"⚠️  Error processing {img_file.name}: {e}")
                 continue
     
     # Create COCO annotations
-    print(f"\n📝 Creating COCO annotations...")
+    logger.info(f"\n📝 Creating COCO annotations...")
     annotations = create_coco_annotations(images_info, output_split)
     
     # Create COCO format JSON
@@ -181,10 +240,10 @@ def convert_split(input_dir, output_dir, split_name):
         ],
         'images': [
             {
-                'id': img['id'],
-                'file_name': img['file_name'],
-                'width': img['width'],
-                'height': img['height']
+                'id': img.id,
+                'file_name': img.file_name,
+                'width': img.width,
+                'height': img.height
             }
             for img in images_info
         ],
@@ -197,18 +256,18 @@ def convert_split(input_dir, output_dir, split_name):
         json.dump(coco_data, f, indent=2)
     
     # Print statistics
-    print(f"\n✅ {output_split.upper()} Split Complete:")
-    print(f"   Total images: {len(images_info)}")
-    print(f"   Total annotations: {len(annotations)}")
-    print(f"   Images with defects: {sum(1 for img in images_info if img['category_id'] > 0)}")
-    print(f"   Images without defects: {sum(1 for img in images_info if img['category_id'] == 0)}")
-    print(f"   Saved to: {images_dir.parent}")
+    logger.info(f"\n✅ {output_split.upper()} Split Complete:")
+    logger.info(f"   Total images: {len(images_info)}")
+    logger.info(f"   Total annotations: {len(annotations)}")
+    logger.info(f"   Images with defects: {sum(1 for img in images_info if img.category_id > 0)}")
+    logger.info(f"   Images without defects: {sum(1 for img in images_info if img.category_id == 0)}")
+    logger.info(f"   Saved to: {images_dir.parent}")
     
     # Class distribution
-    print(f"\n   Class distribution:")
+    logger.info(f"\n   Class distribution:")
     for class_name, class_id in sorted(CLASS_MAPPING.items(), key=lambda x: x[1]):
-        count = sum(1 for img in images_info if img['category_id'] == class_id)
-        print(f"     {class_name:15s}: {count:5d} images")
+        count = sum(1 for img in images_info if img.category_id == class_id)
+        logger.info(f"     {class_name:15s}: {count:5d} images")
     
     return len(images_info), len(annotations)
 
@@ -258,7 +317,7 @@ Weld Defect Classes:
             total_images += num_images
             total_annotations += num_annotations
         else:
-            print(f"⚠️  Skipping {split} (directory not found)")
+            logger.warning(f"⚠️  Skipping {split} (directory not found)")
     
     # Create dataset metadata
     metadata = {
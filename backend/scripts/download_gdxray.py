@@ -12,10 +12,14 @@ import os
 import urllib.request
 import zipfile
 import argparse
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import json
 from typing import Dict, List
-import shutil
 
 
 # GDXray dataset information
@@ -33,28 +37,211 @@ GDXRAY_URLS = {
 }
 
 
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MB
+
+
 def download_file(url: str, output_path: Path, description: str = ""):
-    """Download file with progress bar."""
+    """Download file in 1 MB chunks with a throttled progress display."""
     print(f"📥 Downloading {description}...")
     print(f"   URL: {url}")
     print(f"   Output: {output_path}")
     
-    def progress_hook(count, block_size, total_size):
-        percent = int(count * block_size * 100 / total_size)
-        print(f"\r   Progress: {percent}%", end='')
+    with urllib.request.urlopen(url, timeout=30) as response, open(output_path, 'wb') as f:
+        total_size = int(response.headers.get('Content-Length') or 0)
+        downloaded = 0
+        last_report = 0.0
+        while True:
+            chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+            downloaded += len(chunk)
+            
+            # Refresh at most twice per second rather than once per block
+            now = time.monotonic()
+            if now - last_report >= 0.5:
+                last_report = now
+                if total_size:
+                    print(f"\r   Progress: {downloaded * 100 // total_size}%", end='', flush=True)
+                else:
+                    print(f"\r   Progress: {downloaded / 1e6:.0f} MB", end='', flush=True)
     
-    urllib.request.urlretrieve(url, output_path, reporthook=progress_hook)
     print(f"\n✅ Download complete!")
 
 
-def extract_zip(zip_path: Path, extract_to: Path):
-    """Extract ZIP file."""
+def _extract_members(zip_path: Path, infos: List[zipfile.ZipInfo], extract_to: Path):
+    """Extract a batch of ZIP members through one ZipFile handle of their own."""
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        for info in infos:
+            zf.extract(info, extract_to)
+
+
+# Written to the extraction directory (holding the archive's size and mtime)
+# once extraction has finished, so re-runs can skip inflating an unchanged archive
+EXTRACTED_SENTINEL = '.extracted_ok'
+
+
+def archive_stamp(zip_path: Path) -> str:
+    """Identify a downloaded archive by size and mtime (no need to re-read ~2.5 GB)."""
+    stat = zip_path.stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def extract_zip(zip_path: Path, extract_to: Path, skip: set = None):
+    """Extract ZIP file, inflating members in parallel threads.
+    
+    Members whose names are in ``skip`` (e.g. already streamed out during the
+    download) are left untouched.
+    """
     print(f"📦 Extracting {zip_path.name}...")
+    skip = skip or set()
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_to)
+        infos = [info for info in zip_ref.infolist() if info.filename not in skip]
+    
+    # Create the directory tree up front so workers never race on mkdir
+    file_infos = []
+    for info in infos:
+        if info.is_dir():
+            (extract_to / info.filename).mkdir(parents=True, exist_ok=True)
+        else:
+            (extract_to / info.filename).parent.mkdir(parents=True, exist_ok=True)
+            file_infos.append(info)
+    
+    # zlib releases the GIL while inflating, so threads scale across cores;
+    # each worker inflates an interleaved share of the members
+    num_workers = os.cpu_count() or 1
+    batches = [file_infos[i::num_workers] for i in range(num_workers)]
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        list(executor.map(lambda batch: _extract_members(zip_path, batch, extract_to), batches))
     print(f"✅ Extraction complete!")
 
 
+def _read_when_available(f, offset: int, size: int, download_done: threading.Event):
+    """Read ``size`` bytes at ``offset`` from a file that is still growing.
+    
+    Returns None if the download finished before that many bytes arrived.
+    """
+    while True:
+        if os.fstat(f.fileno()).st_size >= offset + size:
+            f.seek(offset)
+            return f.read(size)
+        if download_done.is_set() and os.fstat(f.fileno()).st_size < offset + size:
+            return None
+        time.sleep(0.2)
+
+
+def stream_extract(zip_path: Path, extract_to: Path, download_done: threading.Event) -> set:
+    """Extract members of a ZIP while it is still being downloaded.
+    
+    Walks the local file headers in offset order as bytes land on disk and
+    inflates each member as soon as its compressed data is complete. Stops at
+    the central directory, or at the first member it cannot size up front
+    (data descriptor, ZIP64, encryption, unusual paths); ``extract_zip`` then
+    picks up whatever is left once the download has finished.
+    
+    Returns:
+        Names of the members that were extracted.
+    """
+    extracted = set()
+    while not zip_path.exists():
+        if download_done.is_set():
+            return extracted
+        time.sleep(0.2)
+    
+    offset = 0
+    with open(zip_path, 'rb') as f:
+        while True:
+            header = _read_when_available(f, offset, 30, download_done)
+            if header is None or header[:4] != b'PK\x03\x04':
+                break
+            _, _, flags, method, _, _, crc, comp_size, _, name_len, extra_len = \
+                struct.unpack('<4sHHHHHIIIHH', header)
+            if flags & 0x09 or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) \
+                    or comp_size == 0xFFFFFFFF:
+                break
+            
+            name_bytes = _read_when_available(f, offset + 30, name_len + extra_len, download_done)
+            if name_bytes is None:
+                break
+            name = name_bytes[:name_len].decode('utf-8' if flags & 0x800 else 'cp437')
+            if name.startswith(('/', '\\')) or '..' in Path(name).parts:
+                break
+            
+            data_start = offset + 30 + name_len + extra_len
+            data = _read_when_available(f, data_start, comp_size, download_done)
+            if data is None:
+                break
+            
+            target = extract_to / name
+            if name.endswith('/'):
+                target.mkdir(parents=True, exist_ok=True)
+            else:
+                content = zlib.decompress(data, -15) if method == zipfile.ZIP_DEFLATED else data
+                if zlib.crc32(content) != crc:
+                    break
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(content)
+            
+            extracted.add(name)
+            offset = data_start + comp_size
+    
+    return extracted
+
+
+def _fast_copy(src: Path, dst: Path, buffer_size: int = 1 << 20):
+    """Copy file contents without preserving metadata.
+    
+    Tries ``os.copy_file_range`` first on Linux (server-side copy on NFS,
+    reflink on btrfs/XFS), then falls back to unbuffered ``readinto`` into a
+    reused 1 MB buffer.
+    """
+    with open(src, 'rb', buffering=0) as r, open(dst, 'wb', buffering=0) as w:
+        if hasattr(os, 'copy_file_range'):
+            try:
+                remaining = os.fstat(r.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(r.fileno(), w.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return
+            except OSError:
+                pass
+            r.seek(0)
+            w.seek(0)
+            w.truncate()
+        
+        buf = memoryview(bytearray(buffer_size))
+        while n := r.readinto(buf):
+            w.write(buf[:n])
+
+
+def _place(src: Path, dst: Path):
+    """Place a source file into the organized dataset.
+    
+    Hardlinks when possible (originals are never modified, so sharing the
+    inode is safe); otherwise copies the contents.
+    """
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        # Re-running over an existing split: replace the stale entry
+        os.unlink(dst)
+        return _place(src, dst)
+    except OSError:
+        pass
+    _fast_copy(src, dst)
+
+
+def _place_pair(src_img: Path, dst_img: Path, src_ann: Path = None, dst_ann: Path = None):
+    """Place an image and, if present, its annotation file."""
+    _place(src_img, dst_img)
+    if src_ann is not None:
+        _place(src_ann, dst_ann)
+
+
 def organize_dataset(gdxray_path: Path, output_path: Path, category: str):
     """
     Organize GDXray dataset into train/val/test splits.
@@ -115,27 +302,37 @@ def organize_dataset(gdxray_path: Path, output_path: Path, category: str):
     
     print(f"   Split: {len(train_series)} train, {len(val_series)} val, {len(test_series)} test series")
     
-    # Copy files to appropriate splits
-    total_images = 0
+    # Collect (src_img, dst_img, src_ann, dst_ann) placement tasks in one pass
+    # per series directory; sibling annotations are matched from the same listing
+    tasks = []
+    split_counts = {}
     for split_name, split_series in [('train', train_series), ('val', val_series), ('test', test_series)]:
+        images_dir = output_path / split_name / 'images'
+        annotations_dir = output_path / split_name / 'annotations'
         split_images = 0
         for series_dir in split_series:
-            # Copy all PNG images from this series
-            for img_file in series_dir.glob('*.png'):
-                # Copy image
-                dest_img = output_path / split_name / 'images' / img_file.name
-                shutil.copy2(img_file, dest_img)
-                
-                # Copy annotation if exists
-                ann_file = img_file.with_suffix('.txt')
-                if ann_file.exists():
-                    dest_ann = output_path / split_name / 'annotations' / ann_file.name
-                    shutil.copy2(ann_file, dest_ann)
-                
+            with os.scandir(series_dir) as it:
+                entries = [entry for entry in it if entry.is_file()]
+            names = {entry.name for entry in entries}
+            for entry in entries:
+                if not entry.name.endswith('.png'):
+                    continue
+                ann_name = entry.name[:-len('.png')] + '.txt'
+                if ann_name in names:
+                    ann_task = (series_dir / ann_name, annotations_dir / ann_name)
+                else:
+                    ann_task = (None, None)
+                tasks.append((Path(entry.path), images_dir / entry.name) + ann_task)
                 split_images += 1
-                total_images += 1
-        
+        split_counts[split_name] = split_images
+    
+    # Link/copy syscalls release the GIL, so threads overlap their latency
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        list(executor.map(lambda task: _place_pair(*task), tasks))
+    
+    for split_name, split_images in split_counts.items():
         print(f"   ✅ {split_name}: {split_images} images")
+    total_images = len(tasks)
     
     print(f"✅ Dataset organized: {total_images} total images")
     
@@ -144,11 +341,7 @@ def organize_dataset(gdxray_path: Path, output_path: Path, category: str):
         "dataset": "GDXray",
         "category": category,
         "total_images": total_images,
-        "splits": {
-            "train": len(list((output_path / 'train' / 'images').glob('*.png'))),
-            "val": len(list((output_path / 'val' / 'images').glob('*.png'))),
-            "test": len(list((output_path / 'test' / 'images').glob('*.png')))
-        },
+        "splits": split_counts,
         "source": GDXRAY_URLS[category]["url"],
         "description": GDXRAY_URLS[category]["description"]
     }
@@ -192,23 +385,56 @@ def main():
 📁 Output: {output_dir.absolute()}
 """)
     
-    # Download
+    # Download (members are extracted while the archive is still arriving)
+    streamed = set()
+    sentinel = temp_dir / EXTRACTED_SENTINEL
     if not args.skip_download or not zip_path.exists():
-        try:
-            download_file(category_info['url'], zip_path, args.category)
-        except Exception as e:
-            print(f"❌ Download failed: {e}")
-            print(f"\n💡 Manual download instructions:")
-            print(f"   1. Visit: {category_info['url']}")
-            print(f"   2. Download the ZIP file")
-            print(f"   3. Place it at: {zip_path}")
-            print(f"   4. Run this script again with --skip-download")
-            return
+        download_done = threading.Event()
+        sentinel.unlink(missing_ok=True)
+        if zip_path.exists():
+            zip_path.unlink()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            streaming = executor.submit(stream_extract, zip_path, temp_dir, download_done)
+            try:
+                download_file(category_info['url'], zip_path, args.category)
+            except Exception as e:
+                print(f"❌ Download failed: {e}")
+                print(f"\n💡 Manual download instructions:")
+                print(f"   1. Visit: {category_info['url']}")
+                print(f"   2. Download the ZIP file")
+                print(f"   3. Place it at: {zip_path}")
+                print(f"   4. Run this script again with --skip-download")
+                return
+            finally:
+                download_done.set()
+            try:
+                streamed = streaming.result()
+                print(f"   Extracted {len(streamed)} entries during download")
+            except Exception as e:
+                # e.g. disk full or a corrupt member; redo everything below
+                print(f"⚠️  Extraction during download failed: {e}")
+                print(f"   Falling back to a full extraction")
+                streamed = set()
     else:
         print(f"✅ Using existing download: {zip_path}")
     
-    # Extract
-    extract_zip(zip_path, temp_dir)
+    # Extract whatever was not already streamed out, unless this exact
+    # archive was fully extracted by a previous run
+    stamp = archive_stamp(zip_path)
+    if sentinel.exists() and sentinel.read_text().strip() == stamp:
+        print(f"✅ {zip_path.name} already extracted, skipping extraction")
+    else:
+        if not streamed:
+            # Reused archive: make sure it is complete before inflating it
+            try:
+                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                    zip_ref.infolist()
+            except zipfile.BadZipFile as e:
+                print(f"❌ Corrupt archive {zip_path}: {e}")
+                print(f"   Delete it and run this script again without --skip-download")
+                return
+        extract_zip(zip_path, temp_dir, skip=streamed)
+        sentinel.write_text(stamp)
     
     # Organize
     organize_dataset(temp_dir, output_dir, args.category)
@@ -14,21 +14,29 @@ Date: 2025-01-20
 import argparse
 import json
 import logging
+import os
+from collections import defaultdict
 from pathlib import Path
 from datetime import datetime
 
 import torch
 import numpy as np
+from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 import mlflow
 
+try:
+    import orjson
+except ImportError:  # optional: faster parsing of large annotation files
+    orjson = None
+
 from core.models.detector import DefectDetector
 from core.preprocessing.image_processor import ImageProcessor
 from core.metrics.business_metrics import (
     calculate_confusion_matrix_metrics,
     get_business_metrics_report
 )
-from core.metrics.detection_metrics import calculate_map, calculate_auroc
+from core.metrics.detection_metrics import calculate_map_arrays, calculate_auroc
 from core.metrics.segmentation_metrics import calculate_mean_iou
 from core.uncertainty.calibration import calculate_ece
 
@@ -36,6 +44,56 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _cached_preprocess(img_path: Path, image_processor: ImageProcessor) -> np.ndarray:
+    """Load a preprocessed (C, H, W) float32 image, using an on-disk cache.
+    
+    Cache files live next to the images under ``.cache/`` and are keyed by
+    file stem and target size. They are memory-mapped on reuse and rebuilt
+    when the source image is newer than the cache.
+    """
+    height, width = image_processor.target_size
+    cache_path = img_path.parent / '.cache' / f"{img_path.stem}_{height}x{width}.npy"
+    
+    try:
+        if cache_path.stat().st_mtime >= img_path.stat().st_mtime:
+            return np.load(cache_path, mmap_mode='r')
+    except FileNotFoundError:
+        pass
+    
+    image = image_processor.load_image(str(img_path))
+    array = np.ascontiguousarray(
+        image_processor.to_tensor(image_processor.preprocess(image)), dtype=np.float32
+    )
+    
+    cache_path.parent.mkdir(exist_ok=True)
+    tmp_path = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, cache_path)
+    return array
+
+
+class TestImageDataset(Dataset):
+    """Loads and preprocesses test images in DataLoader workers."""
+    
+    def __init__(self, test_data: list, image_processor: ImageProcessor, use_cache: bool = True):
+        self.test_data = test_data
+        self.image_processor = image_processor
+        self.use_cache = use_cache
+    
+    def __len__(self):
+        return len(self.test_data)
+    
+    def __getitem__(self, idx):
+        image_path = self.test_data[idx]['image_path']
+        if self.use_cache:
+            return torch.from_numpy(np.array(_cached_preprocess(Path(image_path), self.image_processor)))
+        
+        image = self.image_processor.load_image(image_path)
+        preprocessed = self.image_processor.preprocess(image)
+        return torch.from_numpy(self.image_processor.to_tensor(preprocessed)).float()
+
+
 def load_test_data(data_dir: Path):
     """
     Load test dataset.
@@ -53,16 +111,16 @@ def load_test_data(data_dir: Path):
     if not annotations_file.exists():
         raise FileNotFoundError(f"Annotations not found: {annotations_file}")
     
-    with open(annotations_file, 'r') as f:
-        annotations = json.load(f)
+    if orjson is not None:
+        annotations = orjson.loads(annotations_file.read_bytes())
+    else:
+        with open(annotations_file, 'r') as f:
+            annotations = json.load(f)
     
     # Create image_id to annotations mapping
-    image_annotations = {}
+    image_annotations = defaultdict(list)
     for ann in annotations.get('annotations', []):
-        img_id = ann['image_id']
-        if img_id not in image_annotations:
-            image_annotations[img_id] = []
-        image_annotations[img_id].append(ann)
+        image_annotations[ann['image_id']].append(ann)
     
     # Load images and their annotations
     test_data = []
@@ -85,6 +143,9 @@ def evaluate_model(
     test_data: list,
     image_processor: ImageProcessor,
     device: str,
+    batch_size: int = 16,
+    num_workers: int = 4,
+    use_cache: bool = True,
 ) -> dict:
     """
     Evaluate model on test dataset.
@@ -94,90 +155,141 @@ def evaluate_model(
         test_data: List of test samples
         image_processor: Image preprocessor
         device: Device to run evaluation on
+        batch_size: Number of images per forward pass
+        num_workers: DataLoader workers for decoding/preprocessing
+        use_cache: Reuse preprocessed tensors cached on disk across runs
         
     Returns:
         Dictionary of evaluation metrics
     """
     model.model.eval()
     
-    all_predictions = []
-    all_ground_truth = []
-    all_confidences = []
-    all_pred_labels = []
-    all_true_labels = []
+    # Flat per-box rows: [image_idx, x1, y1, x2, y2, score, label] for
+    # predictions and [image_idx, x1, y1, x2, y2, label] for ground truth
+    pred_chunks = []
+    gt_chunks = []
+    image_scores = []
+    image_labels = []
     
     logger.info(f"Evaluating on {len(test_data)} test images...")
     
-    with torch.no_grad():
-        for sample in tqdm(test_data, desc="Evaluating"):
-            # Load and preprocess image
-            image = image_processor.load_image(sample['image_path'])
-            preprocessed = image_processor.preprocess(image)
-            image_tensor = torch.from_numpy(
-                image_processor.to_tensor(preprocessed)
-            ).float().unsqueeze(0).to(device)
-            
-            # Get predictions
-            predictions = model.predict(image_tensor)
-            
-            # Extract ground truth
-            gt_boxes = [ann['bbox'] for ann in sample['annotations']]
-            gt_labels = [ann['category_id'] for ann in sample['annotations']]
-            
-            # Store for metrics calculation
-            all_predictions.append({
-                'boxes': [det['box'] for det in predictions],
-                'scores': [det['score'] for det in predictions],
-                'labels': [det['label'] for det in predictions],
-            })
+    loader = DataLoader(
+        TestImageDataset(test_data, image_processor, use_cache=use_cache),
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+    )
+    
+    # On CUDA, batches are copied into preallocated pinned host buffers and
+    # sent to preallocated device buffers on a side stream. Two slots are used
+    # so the next batch's H2D copy overlaps with the current batch's inference.
+    on_cuda = device == 'cuda'
+    cpu_buffers = []
+    gpu_buffers = []
+    copy_stream = torch.cuda.Stream() if on_cuda else None
+    
+    def stage(image_batch, slot):
+        """Start the transfer of a loader batch into buffer ``slot``."""
+        if not on_cuda:
+            return image_batch
+        
+        if not cpu_buffers:
+            shape = (batch_size, *image_batch.shape[1:])
+            for _ in range(2):
+                cpu_buffers.append(torch.empty(shape, dtype=torch.float32, pin_memory=True))
+                gpu_buffers.append(torch.empty(shape, dtype=torch.float32, device=device))
+        
+        n = len(image_batch)
+        cpu_buffers[slot][:n].copy_(image_batch)
+        with torch.cuda.stream(copy_stream):
+            gpu_buffers[slot][:n].copy_(cpu_buffers[slot][:n], non_blocking=True)
+        return gpu_buffers[slot][:n]
+    
+    with torch.inference_mode():
+        batch_start = 0
+        batches = iter(tqdm(loader, desc="Evaluating"))
+        first_batch = next(batches, None)
+        staged = stage(first_batch, 0) if first_batch is not None else None
+        slot = 0
+        
+        while staged is not None:
+            if on_cuda:
+                torch.cuda.current_stream().wait_stream(copy_stream)
+            image_batch = staged
             
-            all_ground_truth.append({
-                'boxes': gt_boxes,
-                'labels': gt_labels,
-            })
+            # Queue the next batch's transfer before running this one
+            next_batch = next(batches, None)
+            slot ^= 1
+            staged = stage(next_batch, slot) if next_batch is not None else None
             
-            # Collect confidences and labels for calibration
-            for det in predictions:
-                all_confidences.append(det['score'])
-                all_pred_labels.append(1 if det['label'] == 'defect' else 0)
+            # Get predictions for the whole batch in one forward pass
+            batch_predictions = model.predict_batch(image_batch)
+            batch_samples = test_data[batch_start:batch_start + len(batch_predictions)]
+            batch_start += len(batch_predictions)
             
-            for gt_label in gt_labels:
-                all_true_labels.append(1 if gt_label == 1 else 0)
+            for image_idx, (sample, predictions) in enumerate(
+                zip(batch_samples, batch_predictions), start=batch_start - len(batch_predictions)
+            ):
+                # Extract ground truth
+                gt_labels = [ann['category_id'] for ann in sample['annotations']]
+                
+                # Store for metrics calculation
+                if predictions:
+                    pred_chunks.append(np.array([
+                        [image_idx, *det['box'], det['score'], det['class_id']]
+                        for det in predictions
+                    ], dtype=np.float32))
+                
+                if gt_labels:
+                    gt_chunks.append(np.array([
+                        [image_idx, *ann['bbox'], ann['category_id']]
+                        for ann in sample['annotations']
+                    ], dtype=np.float32))
+                
+                # Image-level score (most confident defect detection) and label
+                # (image has a defect annotation) for calibration/AUROC
+                scores = np.fromiter(
+                    (det['score'] for det in predictions if det['label'] == 'defect'),
+                    dtype=np.float32
+                )
+                image_scores.append(scores.max() if scores.size else 0.0)
+                image_labels.append(any(label == 1 for label in gt_labels))
     
     # Calculate metrics
     logger.info("Calculating metrics...")
     
     # Detection metrics
-    from core.metrics.detection_metrics import calculate_map as compute_map
+    pred_all = np.concatenate(pred_chunks) if pred_chunks else np.empty((0, 7), dtype=np.float32)
+    gt_all = np.concatenate(gt_chunks) if gt_chunks else np.empty((0, 6), dtype=np.float32)
+    
     map_scores = {}
     for iou_threshold in [0.5, 0.75]:
-        map_score = compute_map(all_predictions, all_ground_truth, iou_threshold=iou_threshold)
+        map_score = calculate_map_arrays(pred_all, gt_all, iou_threshold=iou_threshold)
         map_scores[f'mAP@{iou_threshold}'] = map_score
     
+    all_confidences = np.asarray(image_scores, dtype=np.float32)
+    true_binary = np.asarray(image_labels, dtype=np.uint8)
+    
     # AUROC
-    if len(all_confidences) > 0 and len(all_true_labels) > 0:
-        auroc = calculate_auroc(
-            np.array(all_confidences[:len(all_true_labels)]),
-            np.array(all_true_labels)
-        )
+    if all_confidences.size > 0:
+        auroc = calculate_auroc(true_binary, all_confidences)
     else:
         auroc = 0.0
     
     # Business metrics (using simple threshold)
-    pred_binary = np.array([1 if s > 0.5 else 0 for s in all_confidences[:len(all_true_labels)]])
-    true_binary = np.array(all_true_labels)
+    pred_binary = (all_confidences > 0.5).astype(np.uint8)
     
-    if len(pred_binary) > 0:
+    if pred_binary.size > 0:
         business_metrics = calculate_confusion_matrix_metrics(pred_binary, true_binary)
     else:
         business_metrics = {}
     
     # Calibration
-    if len(all_confidences) > 0:
+    if all_confidences.size > 0:
         ece = calculate_ece(
-            torch.tensor(all_confidences[:len(all_true_labels)]),
-            torch.tensor(pred_binary),
-            torch.tensor(true_binary),
+            torch.from_numpy(all_confidences),
+            torch.from_numpy(pred_binary),
+            torch.from_numpy(true_binary),
             n_bins=10
         )
     else:
@@ -190,7 +302,7 @@ def evaluate_model(
         **business_metrics,
         'ECE': float(ece),
         'num_test_samples': len(test_data),
-        'total_predictions': len(all_predictions),
+        'total_predictions': batch_start,
     }
     
     return metrics
@@ -207,6 +319,12 @@ def main():
                        help='Device to use for evaluation')
     parser.add_argument('--output', type=str, default='evaluation_results.json',
                        help='Path to save evaluation results')
+    parser.add_argument('--batch-size', type=int, default=16,
+                       help='Number of images per forward pass')
+    parser.add_argument('--workers', type=int, default=4,
+                       help='DataLoader workers for image preprocessing')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Do not read/write the preprocessed image cache')
     
     args = parser.parse_args()
     
@@ -228,7 +346,11 @@ def main():
     logger.info(f"Loaded {len(test_data)} test samples")
     
     # Evaluate
-    metrics = evaluate_model(model, test_data, image_processor, device)
+    metrics = evaluate_model(
+        model, test_data, image_processor, device,
+        batch_size=args.batch_size, num_workers=args.workers,
+        use_cache=not args.no_cache
+    )
     
     # Log to MLflow
     with mlflow.start_run(run_name="evaluation"):
@@ -8,7 +8,6 @@ as "No Defect" due to low confidence.
 
 import os
 import sys
-from pathlib import Path
 import torch
 from ultralytics import YOLO
 import pandas as pd
@@ -17,14 +16,41 @@ from collections import defaultdict
 import json
 from tqdm import tqdm
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def _iter_class_images(split_dir: str):
+    """Yield (class folder name, image paths) for each class folder in a split.
+    
+    Uses one ``os.scandir`` pass per directory and the cached ``DirEntry``
+    type information, so no per-file ``stat`` calls or ``Path`` objects.
+    """
+    with os.scandir(split_dir) as classes:
+        class_entries = [entry for entry in classes if entry.is_dir()]
+    
+    for class_entry in class_entries:
+        with os.scandir(class_entry.path) as it:
+            image_files = [
+                entry.path for entry in it
+                if entry.is_file(follow_symlinks=False)
+                and entry.name.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+        if image_files:
+            yield class_entry.name, image_files
+
+
 def analyze_classification_confidence(
     model_path: str,
     data_dir: str,
-    splits: list = ['testing', 'validation']
+    splits: list = ['testing', 'validation'],
+    batch_size: int = None
 ):
     """
     Analyze confidence scores for each class prediction.
     Find images where model is uncertain (low confidence on correct class).
+    
+    Images are classified in batches of ``batch_size`` (default: 64 on GPU,
+    8 on CPU).
     """
     
     print("=" * 80)
@@ -40,7 +66,9 @@ def analyze_classification_confidence(
     
     # Check device
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"🔧 Device: {device.upper()}")
+    if batch_size is None:
+        batch_size = 64 if device == 'cuda' else 8
+    print(f"🔧 Device: {device.upper()} (batch size {batch_size})")
     print()
     
     # Class mapping
@@ -51,109 +79,103 @@ def analyze_classification_confidence(
         'NoDifetto': 'ND'
     }
     
-    # Store results
-    all_results = []
-    misclassified_as_nd = []  # Images with defects classified as ND
-    low_confidence_correct = []  # Correct but low confidence
-    
+    # Collect the work list up front so result columns can be preallocated
+    work = []
     for split in splits:
-        split_dir = Path(data_dir) / split
+        split_dir = os.path.join(data_dir, split)
         
-        if not split_dir.exists():
+        if not os.path.isdir(split_dir):
             print(f"⚠️ Skipping {split} (not found)")
             continue
         
-        print(f"\n{'='*80}")
-        print(f"📊 Analyzing {split.upper()} split")
-        print(f"{'='*80}\n")
+        for folder_name, image_files in _iter_class_images(split_dir):
+            work.append((split, class_names.get(folder_name, folder_name), image_files))
+    
+    # Columnar result storage (one slot per image)
+    model_classes = [model.names[i] for i in range(len(model.names))]
+    class_list = list(dict.fromkeys(model_classes + [true_class for _, true_class, _ in work]))
+    class_codes = {name: code for code, name in enumerate(class_list)}
+    model_to_code = np.array([class_codes[name] for name in model_classes], dtype=np.int16)
+    split_codes = {split: code for code, split in enumerate(splits)}
+    
+    n_images = sum(len(image_files) for _, _, image_files in work)
+    image_names = np.empty(n_images, dtype=object)
+    true_codes = np.empty(n_images, dtype=np.int16)
+    pred_codes = np.empty(n_images, dtype=np.int16)
+    split_ids = np.empty(n_images, dtype=np.int16)
+    confidences = np.empty(n_images, dtype=np.float32)
+    all_probs = np.empty((n_images, len(model_classes)), dtype=np.float32)
+    k = 0
+    
+    current_split = None
+    for split, true_class, image_files in work:
+        if split != current_split:
+            current_split = split
+            print(f"\n{'='*80}")
+            print(f"📊 Analyzing {split.upper()} split")
+            print(f"{'='*80}\n")
+        
+        print(f"🔍 Processing {true_class} ({len(image_files)} images)...")
+        class_start = k
+        true_code = class_codes[true_class]
         
-        # Process each class
-        for class_folder in split_dir.iterdir():
-            if not class_folder.is_dir():
+        # Predict images in batches
+        batches = [image_files[b:b + batch_size] for b in range(0, len(image_files), batch_size)]
+        for batch in tqdm(batches, desc=f"  {true_class}", leave=False):
+            try:
+                results = model.predict(batch, verbose=False, device=device,
+                                        half=(device == 'cuda'))
+            except Exception as e:
+                print(f"    ⚠️ Error processing batch starting at {os.path.basename(batch[0])}: {e}")
                 continue
             
-            true_class = class_names.get(class_folder.name, class_folder.name)
-            
-            # Get all images
-            image_files = list(class_folder.glob('*.png')) + \
-                         list(class_folder.glob('*.jpg')) + \
-                         list(class_folder.glob('*.jpeg'))
-            
-            if not image_files:
+            valid = [(img_path, result) for img_path, result in zip(batch, results)
+                     if result.probs is not None]
+            if not valid:
                 continue
             
-            print(f"🔍 Processing {true_class} ({len(image_files)} images)...")
+            # One device->host copy per batch instead of one sync per value
+            batch_probs = torch.stack([result.probs.data for _, result in valid]).float().cpu().numpy()
+            end = k + len(batch_probs)
             
-            class_confidences = []
-            predictions = []
+            image_names[k:end] = [os.path.basename(img_path) for img_path, _ in valid]
+            true_codes[k:end] = true_code
+            pred_codes[k:end] = model_to_code[batch_probs.argmax(axis=1)]
+            split_ids[k:end] = split_codes[split]
+            confidences[k:end] = batch_probs.max(axis=1)
+            all_probs[k:end] = batch_probs
+            k = end
+        
+        # Statistics for this class
+        if k > class_start:
+            class_conf = confidences[class_start:k]
+            class_pred = pred_codes[class_start:k]
+            accuracy = np.mean(class_pred == true_code)
             
-            # Predict each image
-            for img_path in tqdm(image_files, desc=f"  {true_class}", leave=False):
-                try:
-                    # Run prediction
-                    results = model.predict(img_path, verbose=False)
-                    
-                    if len(results) > 0:
-                        result = results[0]
-                        
-                        # Get probabilities for all classes
-                        probs = result.probs
-                        
-                        if probs is not None:
-                            # Get top prediction
-                            top_class_id = int(probs.top1)
-                            top_confidence = float(probs.top1conf)
-                            pred_class = result.names[top_class_id]
-                            
-                            # Get confidence for all classes
-                            all_confs = {result.names[i]: float(probs.data[i]) 
-                                        for i in range(len(probs.data))}
-                            
-                            # Store result
-                            result_data = {
-                                'image': img_path.name,
-                                'true_class': true_class,
-                                'predicted_class': pred_class,
-                                'confidence': top_confidence,
-                                'split': split,
-                                'correct': pred_class == true_class,
-                                **{f'conf_{k}': v for k, v in all_confs.items()}
-                            }
-                            
-                            all_results.append(result_data)
-                            class_confidences.append(top_confidence)
-                            predictions.append(pred_class)
-                            
-                            # Flag issues
-                            if true_class != 'ND' and pred_class == 'ND':
-                                # Defect misclassified as No Defect!
-                                misclassified_as_nd.append(result_data)
-                            
-                            if pred_class == true_class and top_confidence < 0.7:
-                                # Correct but low confidence
-                                low_confidence_correct.append(result_data)
-                
-                except Exception as e:
-                    print(f"    ⚠️ Error processing {img_path.name}: {e}")
-                    continue
+            print(f"  ✅ Accuracy: {accuracy:.2%}")
+            print(f"  📊 Avg Confidence: {class_conf.mean():.4f}")
+            print(f"  📉 Min Confidence: {class_conf.min():.4f}")
             
-            # Statistics for this class
-            if class_confidences:
-                accuracy = sum(1 for p in predictions if p == true_class) / len(predictions)
-                avg_conf = np.mean(class_confidences)
-                min_conf = np.min(class_confidences)
-                
-                print(f"  ✅ Accuracy: {accuracy:.2%}")
-                print(f"  📊 Avg Confidence: {avg_conf:.4f}")
-                print(f"  📉 Min Confidence: {min_conf:.4f}")
-                
-                # Count misclassifications
-                misclass_to_nd = sum(1 for p in predictions if p == 'ND' and true_class != 'ND')
-                if misclass_to_nd > 0 and true_class != 'ND':
-                    print(f"  ⚠️  Misclassified as ND: {misclass_to_nd} ({misclass_to_nd/len(predictions):.1%})")
-    
-    # Create DataFrame
-    df = pd.DataFrame(all_results)
+            # Count misclassifications
+            if true_class != 'ND' and 'ND' in class_codes:
+                misclass_to_nd = int(np.sum(class_pred == class_codes['ND']))
+                if misclass_to_nd > 0:
+                    print(f"  ⚠️  Misclassified as ND: {misclass_to_nd} ({misclass_to_nd/len(class_pred):.1%})")
+    
+    # Create DataFrame from the filled columns
+    df = pd.DataFrame({
+        'image': image_names[:k],
+        'true_class': pd.Categorical.from_codes(true_codes[:k], categories=class_list),
+        'predicted_class': pd.Categorical.from_codes(pred_codes[:k], categories=class_list),
+        'confidence': confidences[:k],
+        'split': pd.Categorical.from_codes(split_ids[:k], categories=splits),
+        'correct': true_codes[:k] == pred_codes[:k],
+        **{f'conf_{name}': all_probs[:k, i] for i, name in enumerate(model_classes)}
+    })
+    
+    # Defects misclassified as No Defect, and correct but low confidence
+    misclass_df = df[(df['true_class'] != 'ND') & (df['predicted_class'] == 'ND')]
+    low_conf_df = df[df['correct'] & (df['confidence'] < 0.7)]
     
     print("\n" + "=" * 80)
     print("📊 OVERALL ANALYSIS")
@@ -165,37 +187,45 @@ def analyze_classification_confidence(
     
     # Per-class accuracy
     print("\n📈 Per-Class Accuracy:")
-    for true_class in df['true_class'].unique():
-        class_df = df[df['true_class'] == true_class]
-        acc = class_df['correct'].mean()
-        avg_conf = class_df['confidence'].mean()
+    class_stats = df.groupby('true_class', sort=False, observed=True).agg(
+        accuracy=('correct', 'mean'),
+        avg_conf=('confidence', 'mean'),
+    )
+    for true_class, acc, avg_conf in class_stats.itertuples():
         print(f"   {true_class:5s} → Accuracy: {acc:.2%}, Avg Confidence: {avg_conf:.4f}")
     
     # Confusion analysis
     print("\n🔀 Confusion Matrix:")
-    confusion = pd.crosstab(df['true_class'], df['predicted_class'], 
-                           rownames=['True'], colnames=['Predicted'])
-    print(confusion)
+    confusion = np.zeros((len(class_list), len(class_list)), dtype=np.int64)
+    np.add.at(confusion, (true_codes[:k], pred_codes[:k]), 1)
+    # Only show classes that actually occur, like a crosstab would
+    rows = confusion.any(axis=1)
+    cols = confusion.any(axis=0)
+    class_index = np.array(class_list, dtype=object)
+    print(pd.DataFrame(
+        confusion[rows][:, cols],
+        index=pd.Index(class_index[rows], name='True'),
+        columns=pd.Index(class_index[cols], name='Predicted'),
+    ))
     
     # Critical issue: Defects misclassified as ND
     print("\n" + "=" * 80)
     print("🚨 CRITICAL: Defects Misclassified as 'No Defect'")
     print("=" * 80)
     
-    if misclassified_as_nd:
-        print(f"\n⚠️  Found {len(misclassified_as_nd)} defects misclassified as ND!")
+    if len(misclass_df):
+        print(f"\n⚠️  Found {len(misclass_df)} defects misclassified as ND!")
         
         # Group by true class
-        misclass_df = pd.DataFrame(misclassified_as_nd)
         print("\n📊 Breakdown by defect type:")
-        for true_class in misclass_df['true_class'].unique():
-            class_errors = misclass_df[misclass_df['true_class'] == true_class]
-            avg_conf = class_errors['confidence'].mean()
-            print(f"   {true_class} → {len(class_errors)} images, Avg ND Confidence: {avg_conf:.4f}")
+        misclass_stats = misclass_df.groupby('true_class', sort=False, observed=True)['confidence'].agg(
+            ['count', 'mean', 'min', 'max']
+        )
+        for true_class, count, avg_conf, min_conf, max_conf in misclass_stats.itertuples():
+            print(f"   {true_class} → {count} images, Avg ND Confidence: {avg_conf:.4f}")
             
             # Show confidence distribution
-            print(f"      Min: {class_errors['confidence'].min():.4f}, "
-                  f"Max: {class_errors['confidence'].max():.4f}")
+            print(f"      Min: {min_conf:.4f}, Max: {max_conf:.4f}")
         
         # Save misclassified images list
         misclass_csv = "models/defects_misclassified_as_nd.csv"
@@ -224,15 +254,14 @@ def analyze_classification_confidence(
     print("📉 Low Confidence Correct Predictions (< 0.7)")
     print("=" * 80)
     
-    if low_confidence_correct:
-        print(f"\n⚠️  Found {len(low_confidence_correct)} correct predictions with low confidence")
+    if len(low_conf_df):
+        print(f"\n⚠️  Found {len(low_conf_df)} correct predictions with low confidence")
         
-        low_conf_df = pd.DataFrame(low_confidence_correct)
         print("\n📊 Breakdown by class:")
-        for true_class in low_conf_df['true_class'].unique():
-            class_low = low_conf_df[low_conf_df['true_class'] == true_class]
-            print(f"   {true_class} → {len(class_low)} images, "
-                  f"Avg Conf: {class_low['confidence'].mean():.4f}")
+        low_conf_stats = low_conf_df.groupby('true_class', sort=False, observed=True)['confidence'].agg(['count', 'mean'])
+        for true_class, count, avg_conf in low_conf_stats.itertuples():
+            print(f"   {true_class} → {count} images, "
+                  f"Avg Conf: {avg_conf:.4f}")
         
         # These are candidates for improvement
         print("\n💡 These images might have minor/unclear defects!")
@@ -247,7 +276,7 @@ def analyze_classification_confidence(
     print("💡 RECOMMENDATIONS")
     print("=" * 80)
     
-    if misclassified_as_nd:
+    if len(misclass_df):
         nd_conf_threshold = misclass_df['confidence'].quantile(0.75)
         print(f"\n1. 🎯 Confidence Threshold Adjustment:")
         print(f"   Current: Model picks class with highest confidence")
@@ -273,7 +302,7 @@ def analyze_classification_confidence(
     
     print()
     
-    return df, misclassified_as_nd, low_confidence_correct
+    return df, misclass_df, low_conf_df
 
 
 def main():
@@ -289,6 +318,8 @@ def main():
                        help='Path to data directory')
     parser.add_argument('--splits', nargs='+', default=['testing', 'validation'],
                        help='Splits to evaluate')
+    parser.add_argument('--batch-size', type=int, default=None,
+                       help='Images per predict call (default: 64 on GPU, 8 on CPU)')
     
     args = parser.parse_args()
     
@@ -305,7 +336,8 @@ def main():
     df, misclass, low_conf = analyze_classification_confidence(
         model_path=args.model,
         data_dir=args.data,
-        splits=args.splits
+        splits=args.splits,
+        batch_size=args.batch_size
     )
     
     print("\n" + "=" * 80)
@@ -313,7 +345,7 @@ def main():
     print("=" * 80)
     print("\n📁 Output Files:")
     print("   • models/classification_confidence_analysis.csv")
-    if misclass:
+    if len(misclass):
         print("   • models/defects_misclassified_as_nd.csv")
     print()
 
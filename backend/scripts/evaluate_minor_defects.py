@@ -5,6 +5,7 @@ This script specifically tests how well the model detects subtle defects
 that might be misclassified as "No Defect".
 """
 
+import argparse
 import os
 import sys
 from pathlib import Path
@@ -15,18 +16,217 @@ import numpy as np
 from collections import defaultdict
 import json
 
+try:
+    import orjson
+except ImportError:  # optional: faster serialization of the threshold report
+    orjson = None
+
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 
+# IoU thresholds for mAP@0.5:0.95 (same as Ultralytics val)
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def _box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (M, 4) and (N, 4) xyxy boxes, shape (M, N)."""
+    lt = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    rb = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area1 = (boxes1[:, 2:] - boxes1[:, :2]).prod(axis=1)
+    area2 = (boxes2[:, 2:] - boxes2[:, :2]).prod(axis=1)
+    return inter / (area1[:, None] + area2[None, :] - inter + 1e-7)
+
+
+def _load_yolo_labels(label_path: str, width: int, height: int) -> np.ndarray:
+    """Load a YOLO label file as (M, 5) rows of [class, x1, y1, x2, y2] in pixels."""
+    try:
+        with open(label_path) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:  # background image, no labels
+        lines = []
+    
+    rows = []
+    for line in lines:
+        values = [float(v) for v in line.split()]
+        if len(values) == 5:
+            cls, cx, cy, w, h = values
+            x1, y1, x2, y2 = cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2
+        elif len(values) > 5:
+            # Segment polygon -> bounding box
+            cls, xs, ys = values[0], values[1::2], values[2::2]
+            x1, y1, x2, y2 = min(xs), min(ys), max(xs), max(ys)
+        else:
+            continue
+        rows.append([cls, x1 * width, y1 * height, x2 * width, y2 * height])
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+
+def _match_predictions(pred_boxes: np.ndarray, pred_cls: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """Mark detections (sorted by descending confidence) as true positives.
+    
+    Each detection greedily claims the best unclaimed same-class target at
+    every IoU threshold. Because matching runs in confidence order, the
+    result for any detection does not depend on lower-confidence ones, so
+    a confidence threshold can be applied afterwards with a simple mask.
+    
+    Returns:
+        Boolean array of shape (N, len(IOU_THRESHOLDS)).
+    """
+    correct = np.zeros((len(pred_boxes), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(pred_boxes) == 0 or len(labels) == 0:
+        return correct
+    
+    iou = _box_iou(labels[:, 1:], pred_boxes)
+    iou *= labels[:, :1] == pred_cls[None, :]
+    
+    claimed = np.zeros((len(labels), len(IOU_THRESHOLDS)), dtype=bool)
+    thresholds = np.arange(len(IOU_THRESHOLDS))
+    for j in np.flatnonzero((iou >= IOU_THRESHOLDS[0]).any(axis=0)):
+        available = np.where(claimed, 0, iou[:, j, None])
+        best = available.argmax(axis=0)
+        correct[j] = available[best, thresholds] >= IOU_THRESHOLDS
+        claimed[best, thresholds] |= correct[j]
+    return correct
+
+
+def collect_test_predictions(
+    model,
+    data_yaml: str,
+    device: str,
+    iou: float = 0.5,
+    batch_size: int = 32
+) -> dict:
+    """Run inference once over the test split and match it against the labels.
+    
+    Predictions are kept down to conf=0.001 so metrics for any higher
+    confidence threshold can be recomputed on CPU without re-running the model.
+    Inference runs in batches of ``batch_size`` and at FP16 on CUDA.
+    
+    Returns:
+        Dictionary of flat arrays: 'tp' (N, 10), 'conf' (N,), 'pred_cls' (N,)
+        and 'target_cls' (M,).
+    
+    Raises:
+        ValueError: If the dataset has no test split.
+    """
+    from ultralytics.data.utils import check_det_dataset, img2label_paths
+    
+    data = check_det_dataset(data_yaml)
+    # predict(source=None) would silently fall back to ultralytics' sample images
+    if not data.get('test'):
+        raise ValueError(f"{data_yaml} has no 'test' split to evaluate on")
+    
+    tp, conf, pred_cls, target_cls = [], [], [], []
+    for result in model.predict(
+        source=data['test'],
+        conf=0.001,
+        iou=iou,
+        device=device,
+        half=(device == 'cuda'),
+        batch=batch_size,
+        stream=True,
+        verbose=False
+    ):
+        height, width = result.orig_shape
+        labels = _load_yolo_labels(img2label_paths([result.path])[0], width, height)
+        
+        boxes = result.boxes.data.cpu().numpy()
+        boxes = boxes[np.argsort(-boxes[:, 4], kind='stable')]
+        
+        tp.append(_match_predictions(boxes[:, :4], boxes[:, 5], labels))
+        conf.append(boxes[:, 4])
+        pred_cls.append(boxes[:, 5])
+        target_cls.append(labels[:, 0])
+    
+    return {
+        'tp': np.concatenate(tp) if tp else np.zeros((0, len(IOU_THRESHOLDS)), dtype=bool),
+        'conf': np.concatenate(conf) if conf else np.zeros(0, dtype=np.float32),
+        'pred_cls': np.concatenate(pred_cls) if pred_cls else np.zeros(0, dtype=np.float32),
+        'target_cls': np.concatenate(target_cls) if target_cls else np.zeros(0, dtype=np.float32),
+    }
+
+
+def metrics_at_threshold(stats: dict, conf_threshold: float, names: dict):
+    """Compute overall and per-class P/R/mAP from cached predictions.
+    
+    Returns:
+        Tuple of (overall metrics dict, per-class DataFrame indexed by class
+        name with 'precision', 'recall' and 'mAP50' columns).
+    """
+    from ultralytics.utils.metrics import ap_per_class
+    
+    # Classes without test labels (or without detections) get zeros
+    p_all = np.zeros(len(names))
+    r_all = np.zeros(len(names))
+    ap50_all = np.zeros(len(names))
+    overall = {'precision': 0.0, 'recall': 0.0, 'mAP50': 0.0, 'mAP50-95': 0.0}
+    
+    mask = stats['conf'] >= conf_threshold
+    if mask.any() and len(stats['target_cls']):
+        _, _, p, r, _, ap, ap_class = ap_per_class(
+            stats['tp'][mask], stats['conf'][mask], stats['pred_cls'][mask], stats['target_cls']
+        )[:7]
+        
+        overall = {
+            'precision': float(p.mean()),
+            'recall': float(r.mean()),
+            'mAP50': float(ap[:, 0].mean()),
+            'mAP50-95': float(ap.mean()),
+        }
+        
+        p_all[ap_class] = p
+        r_all[ap_class] = r
+        ap50_all[ap_class] = ap[:, 0]
+    
+    class_ids = list(names.keys())
+    per_class = pd.DataFrame(
+        {'precision': p_all[class_ids], 'recall': r_all[class_ids], 'mAP50': ap50_all[class_ids]},
+        index=list(names.values())
+    )
+    return overall, per_class
+
+
+def load_engine_model(model_path: str, batch_size: int = 32, imgsz: int = 640):
+    """Load a TensorRT FP16 engine for ``model_path``, exporting it if stale.
+    
+    The engine is written next to the weights and rebuilt whenever the
+    ``.pt`` file is newer. Falls back to the PyTorch weights if the export
+    fails (e.g. TensorRT not installed).
+    """
+    engine_path = Path(model_path).with_suffix('.engine')
+    try:
+        stale = engine_path.stat().st_mtime < os.path.getmtime(model_path)
+    except FileNotFoundError:
+        stale = True
+    if stale:
+        print("⚙️  Exporting TensorRT FP16 engine (one-time)...")
+        try:
+            YOLO(model_path).export(
+                format='engine',
+                half=True,
+                dynamic=True,
+                batch=batch_size,
+                imgsz=imgsz
+            )
+        except Exception as e:
+            print(f"⚠️  TensorRT export failed, using PyTorch weights: {e}")
+            return YOLO(model_path)
+    return YOLO(str(engine_path), task='detect')
+
 
 def evaluate_with_multiple_thresholds(
     model_path: str,
     data_yaml: str,
-    confidence_thresholds: list = [0.1, 0.25, 0.5, 0.7, 0.9]
+    confidence_thresholds: list = [0.1, 0.25, 0.5, 0.7, 0.9],
+    quiet: bool = False
 ):
     """
     Evaluate model with different confidence thresholds to find optimal
     balance for detecting minor defects.
+    
+    With ``quiet`` the per-threshold metric blocks are not printed; the
+    analysis, comparison table and saved files are unchanged.
     """
     
     print("=" * 80)
@@ -37,21 +237,30 @@ def evaluate_with_multiple_thresholds(
     print()
     
     # Check if model exists
-    if not os.path.exists(model_path):
+    if not Path(model_path).is_file():
         print(f"❌ Model not found: {model_path}")
         return
     
-    # Load model
-    print("📥 Loading model...")
-    model = YOLO(model_path)
-    
     # Check device
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     print(f"🔧 Device: {device.upper()}")
     print()
     
+    # Load model (TensorRT engine on GPU)
+    print("📥 Loading model...")
+    if device == 'cuda':
+        model = load_engine_model(model_path)
+    else:
+        model = YOLO(model_path)
+    
     # Store results for each threshold
     all_results = {}
+    per_class_tables = {}
+    
+    # Single inference pass; every threshold below reuses these predictions
+    print("🚀 Running inference on the test split (conf=0.001)...")
+    stats = collect_test_predictions(model, data_yaml, device, iou=0.5)
+    print(f"   Cached {len(stats['conf'])} detections for {len(stats['target_cls'])} labels")
     
     print("=" * 80)
     print("📊 Testing Multiple Confidence Thresholds")
@@ -59,83 +268,66 @@ def evaluate_with_multiple_thresholds(
     print()
     
     for conf_threshold in confidence_thresholds:
-        print(f"\n{'─' * 80}")
-        print(f"🎯 Testing with Confidence Threshold: {conf_threshold}")
-        print(f"{'─' * 80}")
-        
-        # Run validation with specific confidence threshold
-        metrics = model.val(
-            data=data_yaml,
-            conf=conf_threshold,
-            iou=0.5,
-            split='test',  # Use test set for true evaluation
-            device=device,
-            verbose=False,
-            plots=False
-        )
-        
-        # Extract metrics
-        results_dict = metrics.results_dict
-        
-        # Get per-class metrics
-        per_class_metrics = {}
-        if hasattr(metrics, 'box'):
-            # Class names
-            names = model.names
-            
-            # Per-class precision, recall, mAP
-            if hasattr(metrics.box, 'p'):
-                for class_id, class_name in names.items():
-                    per_class_metrics[class_name] = {
-                        'precision': float(metrics.box.p[class_id]) if class_id < len(metrics.box.p) else 0.0,
-                        'recall': float(metrics.box.r[class_id]) if class_id < len(metrics.box.r) else 0.0,
-                        'mAP50': float(metrics.box.ap50[class_id]) if class_id < len(metrics.box.ap50) else 0.0,
-                    }
+        # Recompute metrics from the cached predictions
+        overall, per_class_metrics = metrics_at_threshold(stats, conf_threshold, model.names)
         
         # Store results
+        per_class_tables[conf_threshold] = per_class_metrics
         all_results[conf_threshold] = {
-            'overall': {
-                'precision': float(results_dict.get('metrics/precision(B)', 0)),
-                'recall': float(results_dict.get('metrics/recall(B)', 0)),
-                'mAP50': float(results_dict.get('metrics/mAP50(B)', 0)),
-                'mAP50-95': float(results_dict.get('metrics/mAP50-95(B)', 0)),
-            },
-            'per_class': per_class_metrics
+            'overall': overall,
+            'per_class': per_class_metrics.to_dict('index')
         }
         
-        # Print summary
-        print(f"\n📈 Overall Metrics (conf={conf_threshold}):")
-        print(f"   Precision: {all_results[conf_threshold]['overall']['precision']:.4f}")
-        print(f"   Recall:    {all_results[conf_threshold]['overall']['recall']:.4f}")
-        print(f"   mAP@0.5:   {all_results[conf_threshold]['overall']['mAP50']:.4f}")
+        if quiet:
+            continue
         
-        if per_class_metrics:
-            print(f"\n📊 Per-Class Metrics:")
-            for class_name, metrics in per_class_metrics.items():
-                print(f"\n   {class_name}:")
-                print(f"      Precision: {metrics['precision']:.4f}")
-                print(f"      Recall:    {metrics['recall']:.4f}  {'⚠️ LOW!' if metrics['recall'] < 0.8 else '✅'}")
-                print(f"      mAP@0.5:   {metrics['mAP50']:.4f}")
+        # Print summary as one write per threshold
+        lines = [
+            f"\n{'─' * 80}",
+            f"🎯 Testing with Confidence Threshold: {conf_threshold}",
+            f"{'─' * 80}",
+            f"\n📈 Overall Metrics (conf={conf_threshold}):",
+            f"   Precision: {overall['precision']:.4f}",
+            f"   Recall:    {overall['recall']:.4f}",
+            f"   mAP@0.5:   {overall['mAP50']:.4f}",
+        ]
+        
+        if not per_class_metrics.empty:
+            lines.append(f"\n📊 Per-Class Metrics:")
+            for class_name, precision, recall, map50 in per_class_metrics.itertuples():
+                lines += [
+                    f"\n   {class_name}:",
+                    f"      Precision: {precision:.4f}",
+                    f"      Recall:    {recall:.4f}  {'⚠️ LOW!' if recall < 0.8 else '✅'}",
+                    f"      mAP@0.5:   {map50:.4f}",
+                ]
+        
+        sys.stdout.write('\n'.join(lines) + '\n')
+        sys.stdout.flush()
     
     # Analysis: Find best threshold for defect detection
     print("\n" + "=" * 80)
     print("🎯 ANALYSIS: Best Confidence Threshold for Minor Defects")
     print("=" * 80)
     
-    # Calculate defect recall (excluding "No Defect" class)
-    defect_recalls = {}
-    for conf, results in all_results.items():
-        if 'per_class' in results and results['per_class']:
-            # Average recall for defect classes (LP, PO, CR)
-            defect_classes = [k for k in results['per_class'].keys() if k != 'ND' and k != 'NoDifetto']
-            if defect_classes:
-                recalls = [results['per_class'][cls]['recall'] for cls in defect_classes]
-                defect_recalls[conf] = np.mean(recalls)
-    
-    if defect_recalls:
-        best_threshold = max(defect_recalls.keys(), key=lambda k: defect_recalls[k])
+    # Calculate defect recall (excluding "No Defect" class) as one
+    # (n_thresholds, n_defect_classes) matrix reduced in a single pass
+    thresholds = list(per_class_tables)
+    class_names = per_class_tables[thresholds[0]].index if thresholds else []
+    defect_classes = [c for c in class_names if c != 'ND' and c != 'NoDifetto']
+    defect_recalls = None
+    if defect_classes:
+        recall_matrix = np.stack([
+            per_class_tables[conf].loc[defect_classes, 'recall'].to_numpy(dtype=np.float64)
+            for conf in thresholds
+        ])
+        defect_recalls = recall_matrix.mean(axis=1)
+    
+    if defect_recalls is not None:
+        best_idx = int(defect_recalls.argmax())
+        best_threshold = thresholds[best_idx]
         print(f"\n✅ Best Threshold for Defect Detection: {best_threshold}")
-        print(f"   Average Defect Recall: {defect_recalls[best_threshold]:.4f}")
+        print(f"   Average Defect Recall: {defect_recalls[best_idx]:.4f}")
         print(f"\n💡 Recommendation:")
         print(f"   - Current threshold might be too high ({0.25} default)")
         print(f"   - Lower to {best_threshold} to catch more minor defects")
@@ -144,8 +336,15 @@ def evaluate_with_multiple_thresholds(
     # Save results to JSON
     output_path = "models/threshold_analysis.json"
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w') as f:
-        json.dump(all_results, f, indent=2)
+    if orjson is not None:
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(
+                all_results,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            ))
+    else:
+        with open(output_path, 'w') as f:
+            json.dump(all_results, f, indent=2)
     print(f"\n💾 Results saved to: {output_path}")
     
     # Create comparison DataFrame
@@ -153,23 +352,17 @@ def evaluate_with_multiple_thresholds(
     print("📊 THRESHOLD COMPARISON TABLE")
     print("=" * 80)
     
-    comparison_data = []
-    for conf, results in all_results.items():
-        row = {
-            'Confidence': conf,
-            'Precision': results['overall']['precision'],
-            'Recall': results['overall']['recall'],
-            'mAP@0.5': results['overall']['mAP50'],
-        }
-        
-        # Add per-class recalls
-        if 'per_class' in results and results['per_class']:
-            for class_name, metrics in results['per_class'].items():
-                row[f'{class_name}_Recall'] = metrics['recall']
-        
-        comparison_data.append(row)
+    overall_table = pd.DataFrame(
+        {conf: results['overall'] for conf, results in all_results.items()}
+    ).T[['precision', 'recall', 'mAP50']]
+    overall_table.columns = ['Precision', 'Recall', 'mAP@0.5']
+    
+    # Per-class recalls, one row per threshold
+    recall_table = pd.concat(
+        {conf: table['recall'] for conf, table in per_class_tables.items()}, axis=1
+    ).T.add_suffix('_Recall')
     
-    df = pd.DataFrame(comparison_data)
+    df = pd.concat([overall_table, recall_table], axis=1).rename_axis('Confidence').reset_index()
     print("\n")
     print(df.to_string(index=False))
     
@@ -183,17 +376,21 @@ def evaluate_with_multiple_thresholds(
 
 def main():
     """Main evaluation function."""
+    parser = argparse.ArgumentParser(description="Evaluate minor defect detection across confidence thresholds")
+    parser.add_argument('--quiet', action='store_true',
+                       help='Skip the per-threshold metric printout')
+    args = parser.parse_args()
     
     # Configuration
-    MODEL_PATH = "runs/mlflow/809728953514087462/bc7a3eba72794ad29e1e524408b9d0b1/artifacts/weights/best.pt"
-    DATA_YAML = "../DATA/data.yaml"  # Use the actual DATA directory
+    model_path = Path("runs/mlflow/809728953514087462/bc7a3eba72794ad29e1e524408b9d0b1/artifacts/weights/best.pt")
+    data_yaml = Path("../DATA/data.yaml")  # Use the actual DATA directory
     
-    # Alternative paths if first doesn't exist
-    if not os.path.exists(MODEL_PATH):
-        MODEL_PATH = "models/yolo/radikal_weld_detection/weights/best.pt"
+    # Alternative paths if first doesn't exist (one stat per candidate)
+    if not model_path.is_file():
+        model_path = Path("models/yolo/radikal_weld_detection/weights/best.pt")
     
-    if not os.path.exists(DATA_YAML):
-        DATA_YAML = "models/yolo/riawelc.yaml"
+    if not data_yaml.is_file():
+        data_yaml = Path("models/yolo/riawelc.yaml")
     
     # Test with multiple confidence thresholds
     # Lower thresholds will detect more subtle defects
@@ -205,9 +402,10 @@ def main():
     print()
     
     results = evaluate_with_multiple_thresholds(
-        model_path=MODEL_PATH,
-        data_yaml=DATA_YAML,
-        confidence_thresholds=confidence_thresholds
+        model_path=str(model_path),
+        data_yaml=str(data_yaml),
+        confidence_thresholds=confidence_thresholds,
+        quiet=args.quiet
     )
     
     print("\n" + "=" * 80)
@@ -6,92 +6,173 @@ the training pipeline without requiring real data.
 
 import os
 import json
+import zlib
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 import numpy as np
-from PIL import Image, ImageDraw
-import random
+import cv2
+from PIL import Image
+
+try:
+    import orjson
+except ImportError:  # optional: faster annotation encoding
+    orjson = None
+
+
+# Boolean disk stamps for the background speckle, keyed by radius
+_DISKS = {
+    radius: np.add.outer(np.arange(-radius, radius + 1) ** 2,
+                         np.arange(-radius, radius + 1) ** 2) <= radius ** 2
+    for radius in range(1, 4)
+}
+
+
+def _stamp(img: np.ndarray, x: int, y: int, mask: np.ndarray, value: int):
+    """Set pixels under a centered boolean mask, clipped to the image."""
+    r = mask.shape[0] // 2
+    y0, y1 = max(0, y - r), min(img.shape[0], y + r + 1)
+    x0, x1 = max(0, x - r), min(img.shape[1], x + r + 1)
+    if y0 < y1 and x0 < x1:
+        region = mask[y0 - (y - r):y1 - (y - r), x0 - (x - r):x1 - (x - r)]
+        img[y0:y1, x0:x1][region] = value
 
 
 def generate_synthetic_image(
     size: tuple = (512, 512),
-    num_defects: int = None
+    num_defects: int = None,
+    rng: np.random.Generator = None
 ) -> tuple:
     """Generate a synthetic radiographic-style image with defects.
     
     Args:
         size: Image size (width, height).
         num_defects: Number of defects to generate. If None, random 1-3.
+        rng: Random generator to draw from. If None, a fresh one is created.
         
     Returns:
         Tuple of (image, boxes, labels).
     """
+    if rng is None:
+        rng = np.random.default_rng()
+    
     if num_defects is None:
-        num_defects = random.randint(1, 3)
-    
-    img = Image.new('L', size, color=180)
-    draw = ImageDraw.Draw(img)
-    
-    for _ in range(50):
-        x = random.randint(0, size[0])
-        y = random.randint(0, size[1])
-        radius = random.randint(1, 3)
-        shade = random.randint(150, 210)
-        draw.ellipse(
-            [x - radius, y - radius, x + radius, y + radius],
-            fill=shade
-        )
+        num_defects = int(rng.integers(1, 4))
+    
+    img = np.full((size[1], size[0]), 180, dtype=np.uint8)
+    
+    # Draw all speckle parameters up front, one call per attribute
+    xs = rng.integers(0, size[0] + 1, 50)
+    ys = rng.integers(0, size[1] + 1, 50)
+    radii = rng.integers(1, 4, 50)
+    shades = rng.integers(150, 211, 50)
+    for x, y, radius, shade in zip(xs.tolist(), ys.tolist(), radii.tolist(), shades.tolist()):
+        _stamp(img, x, y, _DISKS[radius], shade)
     
     boxes = []
     labels = []
     
-    for _ in range(num_defects):
-        defect_type = random.choice(['crack', 'void', 'inclusion'])
-        
-        x_center = random.randint(100, size[0] - 100)
-        y_center = random.randint(100, size[1] - 100)
-        width = random.randint(30, 80)
-        height = random.randint(30, 80)
-        
+    defect_types = rng.choice(['crack', 'void', 'inclusion'], num_defects).tolist()
+    x_centers = rng.integers(100, size[0] - 100 + 1, num_defects).tolist()
+    y_centers = rng.integers(100, size[1] - 100 + 1, num_defects).tolist()
+    widths = rng.integers(30, 81, num_defects).tolist()
+    heights = rng.integers(30, 81, num_defects).tolist()
+    
+    for defect_type, x_center, y_center, width, height in zip(
+        defect_types, x_centers, y_centers, widths, heights
+    ):
         x1 = max(0, x_center - width // 2)
         y1 = max(0, y_center - height // 2)
         x2 = min(size[0], x_center + width // 2)
         y2 = min(size[1], y_center + height // 2)
         
         if defect_type == 'crack':
-            for i in range(10):
-                px = x_center + random.randint(-width // 2, width // 2)
-                py = y_center + random.randint(-height // 2, height // 2)
-                draw.line(
-                    [px, py, px + random.randint(-5, 5), py + random.randint(-5, 5)],
-                    fill=80,
-                    width=2
-                )
-        elif defect_type == 'void':
-            draw.ellipse(
-                [x1, y1, x2, y2],
-                fill=50
+            # All 10 crack segments in one polylines call
+            starts = np.column_stack([
+                x_center + rng.integers(-width // 2, width // 2 + 1, 10),
+                y_center + rng.integers(-height // 2, height // 2 + 1, 10),
+            ])
+            ends = starts + rng.integers(-5, 6, (10, 2))
+            cv2.polylines(
+                img,
+                np.stack([starts, ends], axis=1).astype(np.int32),
+                isClosed=False,
+                color=80,
+                thickness=2
             )
+        elif defect_type == 'void':
+            yy, xx = np.ogrid[y1:y2 + 1, x1:x2 + 1]
+            rx = max((x2 - x1) / 2, 0.5)
+            ry = max((y2 - y1) / 2, 0.5)
+            ellipse = ((xx - (x1 + x2) / 2) / rx) ** 2 + ((yy - (y1 + y2) / 2) / ry) ** 2 <= 1
+            img[y1:y2 + 1, x1:x2 + 1][ellipse] = 50
         else:
-            draw.rectangle(
-                [x1, y1, x2, y2],
-                fill=220
-            )
+            img[y1:y2 + 1, x1:x2 + 1] = 220
         
         boxes.append([float(x1), float(y1), float(x2), float(y2)])
         labels.append(1)
     
-    img_rgb = img.convert('RGB')
+    img_rgb = Image.fromarray(img).convert('RGB')
     
     return img_rgb, boxes, labels
 
 
+def _dump_line(record: dict) -> bytes:
+    """Encode one annotation record as a JSON Lines entry."""
+    if orjson is not None:
+        return orjson.dumps(record) + b'\n'
+    return (json.dumps(record) + '\n').encode('utf-8')
+
+
+def generate_one(
+    i: int,
+    split_name: str,
+    images_dir: Path,
+    image_size: tuple,
+    seed: int
+) -> dict:
+    """Generate and save one sample; safe to run in a worker process.
+    
+    Args:
+        i: Sample index within the split.
+        split_name: Name of the split (used in the file name).
+        images_dir: Directory to write the image to.
+        image_size: Image size (width, height).
+        seed: Dataset-level seed, combined with the split and index.
+        
+    Returns:
+        Annotation dictionary for the sample.
+    """
+    # Independent generator per sample, so workers never share or repeat a stream
+    rng = np.random.default_rng([seed, zlib.crc32(split_name.encode()), i])
+    
+    image_filename = f"{split_name}_{i:04d}.jpg"
+    
+    img, boxes, labels = generate_synthetic_image(size=image_size, rng=rng)
+    
+    # OpenCV's JPEG encoder (libjpeg-turbo in the wheels) is faster than PIL's
+    cv2.imwrite(
+        str(images_dir / image_filename),
+        np.asarray(img)[:, :, ::-1],
+        [cv2.IMWRITE_JPEG_QUALITY, 95, cv2.IMWRITE_JPEG_OPTIMIZE, 0]
+    )
+    
+    return {
+        'image_file': image_filename,
+        'boxes': boxes,
+        'labels': labels
+    }
+
+
 def generate_dataset(
     output_dir: str,
     num_train: int = 100,
     num_val: int = 20,
     num_test: int = 20,
-    image_size: tuple = (512, 512)
+    image_size: tuple = (512, 512),
+    num_workers: int = None,
+    seed: int = None
 ):
     """Generate synthetic dataset with train/val/test splits.
     
@@ -101,9 +182,14 @@ def generate_dataset(
         num_val: Number of validation samples.
         num_test: Number of test samples.
         image_size: Image size (width, height).
+        num_workers: Worker processes for generation (default: CPU count).
+        seed: Seed for reproducible output. If None, fresh OS entropy is used.
     """
     output_path = Path(output_dir)
     
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    
     splits = {
         'train': num_train,
         'val': num_val,
@@ -117,28 +203,21 @@ def generate_dataset(
         images_dir = split_dir / 'images'
         images_dir.mkdir(parents=True, exist_ok=True)
         
-        annotations = []
-        
-        for i in range(num_samples):
-            image_filename = f"{split_name}_{i:04d}.jpg"
-            image_path = images_dir / image_filename
-            
-            img, boxes, labels = generate_synthetic_image(size=image_size)
-            
-            img.save(image_path, quality=95)
-            
-            annotations.append({
-                'image_file': image_filename,
-                'boxes': boxes,
-                'labels': labels
-            })
-            
-            if (i + 1) % 10 == 0:
-                print(f"  Generated {i + 1}/{num_samples} images")
+        annotations_path = split_dir / 'annotations.jsonl'
         
-        annotations_path = split_dir / 'annotations.json'
-        with open(annotations_path, 'w') as f:
-            json.dump(annotations, f, indent=2)
+        # Samples are independent, so generate them across processes; each
+        # annotation is appended as one JSON line as soon as it arrives
+        worker = partial(
+            generate_one, split_name=split_name, images_dir=images_dir, image_size=image_size,
+            seed=seed
+        )
+        with ProcessPoolExecutor(max_workers=num_workers or os.cpu_count()) as executor, \
+                open(annotations_path, 'wb') as f:
+            for i, annotation in enumerate(executor.map(worker, range(num_samples), chunksize=4)):
+                f.write(_dump_line(annotation))
+                
+                if (i + 1) % 10 == 0:
+                    print(f"  Generated {i + 1}/{num_samples} images")
         
         print(f"  Saved annotations to {annotations_path}")
         print(f"  {split_name} split complete!")
@@ -152,13 +231,13 @@ def generate_dataset(
     print(f"{output_dir}/")
     print("├── train/")
     print("│   ├── images/ ({} images)".format(num_train))
-    print("│   └── annotations.json")
+    print("│   └── annotations.jsonl")
     print("├── val/")
     print("│   ├── images/ ({} images)".format(num_val))
-    print("│   └── annotations.json")
+    print("│   └── annotations.jsonl")
     print("└── test/")
     print("    ├── images/ ({} images)".format(num_test))
-    print("    └── annotations.json")
+    print("    └── annotations.jsonl")
 
 
 def main():
@@ -197,6 +276,18 @@ def main():
         default=[512, 512],
         help='Image size as width height (default: 512 512)'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Worker processes for generation (default: CPU count)'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='Random seed for a reproducible dataset (default: random)'
+    )
     
     args = parser.parse_args()
     
@@ -217,7 +308,9 @@ def main():
         num_train=args.num_train,
         num_val=args.num_val,
         num_test=args.num_test,
-        image_size=tuple(args.image_size)
+        image_size=tuple(args.image_size),
+        num_workers=args.workers,
+        seed=args.seed
     )
     
     print("=" * 60)
@@ -6,6 +6,7 @@ Works offline, no update checks
 import os
 import sys
 import warnings
+from pathlib import Path
 
 # Disable online checks and warnings
 os.environ['YOLO_OFFLINE'] = '1'
@@ -48,12 +49,12 @@ def simple_train():
     data_yaml = 'models/yolo/riawelc.yaml'
     model_path = os.path.expanduser('~/.cache/yolov8s.pt')
     
-    if not os.path.exists(model_path):
+    if not Path(model_path).is_file():
         print(f"\n❌ Model not found: {model_path}")
         print("   Downloading yolov8s.pt...")
         model_path = 'yolov8s.pt'  # Will auto-download
     
-    if not os.path.exists(data_yaml):
+    if not Path(data_yaml).is_file():
         print(f"\n❌ Dataset config not found: {data_yaml}")
         print("   Please run the full train_yolo.py first to create it.")
         return
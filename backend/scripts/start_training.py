@@ -3,9 +3,11 @@ Start YOLOv8 Training with Network Bypass
 This script patches Ultralytics to work without network access
 """
 
-import os
 import sys
 
+from _training import choose_cache_mode, patch_dataloaders, to_channels_last
+from _weights import weights_path
+
 # Step 1: Patch the check_font function before importing ultralytics
 def patch_ultralytics():
     """Patch ultralytics to skip font downloads"""
@@ -19,6 +21,11 @@ def patch_ultralytics():
     
     checks.check_font = patched_check_font
     print("✅ Patched check_font to skip downloads")
+    
+    # Pinned host memory, persistent workers and deeper prefetch for every
+    # training dataloader
+    patch_dataloaders()
+    print("✅ Patched dataloaders for pinned memory and prefetch_factor=4")
 
 def main():
     print("=" * 70)
@@ -38,6 +45,11 @@ def main():
         print("   Install: pip install torch torchvision --index-url https://download.pytorch.org/whl/cu121")
         return
     
+    # Let cuDNN pick the fastest conv kernels (fixed 640x640 inputs) and
+    # allow TF32 for float32 matmuls
+    torch.backends.cudnn.benchmark = True
+    torch.set_float32_matmul_precision('high')
+    
     gpu_name = torch.cuda.get_device_name(0)
     print(f"\n🔧 Hardware:")
     print(f"   GPU: {gpu_name}")
@@ -45,23 +57,30 @@ def main():
     print(f"   CUDA: {torch.version.cuda}")
     
     # Configuration
-    model_path = os.path.expanduser('~/.cache/yolov8s.pt')
+    model_path = weights_path('s')
     data_yaml = 'models/yolo/riawelc.yaml'
     
     print(f"\n📊 Training Configuration:")
     print(f"   Model: YOLOv8s (11.2M parameters)")
     print(f"   Dataset: RIAWELC (24,407 images)")
     print(f"   Epochs: 50")
-    print(f"   Batch Size: 16")
+    print(f"   Batch Size: auto (largest that fits in GPU memory)")
     print(f"   Image Size: 640x640")
     print(f"   Device: GPU 0")
     print(f"   Expected Time: 2-4 hours")
     
+    cache_mode = choose_cache_mode(data_yaml, imgsz=640)
+    print(f"   Image Cache: {cache_mode}")
+    
     # Load model
     print(f"\n📥 Loading pre-trained model...")
     model = YOLO(model_path)
     print(f"✅ Model loaded successfully!")
     
+    # The trainer rebuilds the network, so switch its model (not ours) and
+    # its input batches to channels-last once setup is done
+    model.add_callback('on_pretrain_routine_end', to_channels_last)
+    
     # Start training
     print(f"\n🏋️  Starting Training...")
     print("=" * 70)
@@ -71,7 +90,8 @@ def main():
         results = model.train(
             data=data_yaml,
             epochs=50,
-            batch=16,
+            batch=-1,                 # AutoBatch: size batch to available VRAM
+            nbs=64,                   # Nominal batch for loss/weight-decay scaling
             imgsz=640,
             device=0,
             project='models/yolo',
@@ -82,7 +102,7 @@ def main():
             exist_ok=True,            # Overwrite existing
             verbose=True,             # Detailed output
             plots=True,               # Generate plots
-            cache=False,              # Don't cache (saves memory)
+            cache=cache_mode,         # Decoded images in RAM if they fit, else disk
             workers=8,                # Data loading workers
             optimizer='AdamW',        # Optimizer
             lr0=0.01,                 # Initial learning rate
@@ -91,6 +111,7 @@ def main():
             weight_decay=0.0005,      # Weight decay
             warmup_epochs=3.0,        # Warmup epochs
             close_mosaic=10,          # Close mosaic augmentation
+            amp=True,                 # Mixed precision (FP16 autocast)
         )
         
         print("\n" + "=" * 70)
@@ -126,7 +147,7 @@ def main():
         
         print("\n💡 Troubleshooting:")
         print("   1. Check GPU memory: nvidia-smi")
-        print("   2. Reduce batch size if OOM: batch=8")
+        print("   2. Set a fixed batch size if AutoBatch still OOMs: batch=8")
         print("   3. Check dataset: ls data/train/images")
 
 if __name__ == '__main__':
@@ -7,16 +7,23 @@ optimized for NVIDIA RTX 4050 GPU.
 import os
 import sys
 import argparse
+import contextlib
 import logging
+import math
 from pathlib import Path
 from typing import Dict, Any, Optional
 from datetime import datetime
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel as DDP
 from torch.utils.data import DataLoader, Dataset
+from torch.utils.data.distributed import DistributedSampler
 import numpy as np
+import torchvision
 import mlflow
 import mlflow.pytorch
 from tqdm import tqdm
@@ -26,15 +33,28 @@ sys.path.append(str(Path(__file__).parent.parent))
 from core.models.detector import DefectDetector
 from core.preprocessing.image_processor import ImageProcessor
 from core.metrics.business_metrics import calculate_confusion_matrix_metrics
-from core.metrics.detection_metrics import calculate_map
+from core.metrics.detection_metrics import calculate_map_arrays
 
 
 def collate_fn(batch):
     """Custom collate function for DataLoader.
     
     This is defined at module level to avoid pickling issues on Windows.
+    Images of equal size (always the case after ``preprocess``) are stacked
+    into one contiguous (B, C, H, W) tensor, so the batch is pinned and
+    copied to the device in one piece; targets stay a tuple of dicts.
     """
-    return tuple(zip(*batch))
+    images, targets = zip(*batch)
+    if all(image.shape == images[0].shape for image in images):
+        images = torch.stack(images)
+    return images, targets
+
+
+def images_to_device(images, device: torch.device) -> list:
+    """Move a collated image batch to ``device`` as a list of (C, H, W) tensors."""
+    if torch.is_tensor(images):
+        return list(images.to(device, non_blocking=True))
+    return [image.to(device, non_blocking=True) for image in images]
 
 logging.basicConfig(
     level=logging.INFO,
@@ -90,7 +110,8 @@ class DefectDataset(Dataset):
         image_dir: str,
         annotation_file: str,
         processor: ImageProcessor,
-        augment: bool = False
+        augment: bool = False,
+        cache_dir: Optional[str] = None
     ):
         """Initialize dataset.
         
@@ -99,10 +120,13 @@ class DefectDataset(Dataset):
             annotation_file: Path to annotation file.
             processor: Image processor instance.
             augment: Whether to apply data augmentation.
+            cache_dir: Directory for preprocessed image tensors. If None,
+                images are decoded and preprocessed on every access.
         """
         self.image_dir = Path(image_dir)
         self.processor = processor
         self.augment = augment
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
         
         self.samples = self._load_annotations(annotation_file)
     
@@ -116,7 +140,6 @@ class DefectDataset(Dataset):
             List of processed sample dictionaries.
         """
         import json
-        from collections import defaultdict
         
         with open(annotation_file, 'r') as f:
             coco_data = json.load(f)
@@ -124,28 +147,32 @@ class DefectDataset(Dataset):
         # Create image_id to filename mapping
         images_dict = {img['id']: img['file_name'] for img in coco_data['images']}
         
-        # Group annotations by image_id
-        annotations_by_image = defaultdict(list)
-        for ann in coco_data['annotations']:
-            annotations_by_image[ann['image_id']].append(ann)
+        # All annotations as flat arrays
+        annotations = coco_data['annotations']
+        image_ids = np.array([ann['image_id'] for ann in annotations])
+        # COCO bbox format: [x, y, width, height] -> [x1, y1, x2, y2]
+        boxes = np.array([ann['bbox'] for ann in annotations], dtype=np.float32).reshape(-1, 4)
+        boxes[:, 2:] += boxes[:, :2]
+        labels = np.fromiter(
+            (ann['category_id'] for ann in annotations), dtype=np.int64, count=len(annotations)
+        )
+        
+        # Group rows by image_id (stable, so per-image annotation order is
+        # kept) and emit images in order of first appearance
+        unique_ids, first_index, group = np.unique(image_ids, return_index=True, return_inverse=True)
+        order = np.argsort(group, kind='stable')
+        counts = np.bincount(group, minlength=len(unique_ids))
+        bounds = np.cumsum(counts)
+        starts = bounds - counts
         
-        # Create samples list
+        # Create samples list with boxes/labels converted to tensors once
         samples = []
-        for img_id, anns in annotations_by_image.items():
-            boxes = []
-            labels = []
-            
-            for ann in anns:
-                # COCO bbox format: [x, y, width, height]
-                x, y, w, h = ann['bbox']
-                # Convert to [x1, y1, x2, y2]
-                boxes.append([x, y, x + w, y + h])
-                labels.append(ann['category_id'])
-            
+        for g in np.argsort(first_index):
+            rows = order[starts[g]:bounds[g]]
             samples.append({
-                'image_file': images_dict[img_id],
-                'boxes': boxes,
-                'labels': labels
+                'image_file': images_dict[unique_ids[g].item()],
+                'boxes': torch.from_numpy(boxes[rows]),
+                'labels': torch.from_numpy(labels[rows])
             })
         
         return samples
@@ -153,6 +180,101 @@ class DefectDataset(Dataset):
     def __len__(self) -> int:
         return len(self.samples)
     
+    def _cache_path(self, image_path: Path) -> Path:
+        """Cache file for an image, keyed by file stem and target size."""
+        height, width = self.processor.target_size
+        return self.cache_dir / f"{image_path.stem}_{height}x{width}.npy"
+    
+    def _is_cached(self, image_path: Path) -> bool:
+        """Whether a cache file exists and is not older than the image."""
+        try:
+            return self._cache_path(image_path).stat().st_mtime >= image_path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+    
+    def _save_to_cache(self, image_path: Path, array: np.ndarray) -> None:
+        """Write a preprocessed array to the cache."""
+        # Write then rename so concurrent workers never read a partial file
+        cache_path = self._cache_path(image_path)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, cache_path)
+    
+    def _load_image_tensor(self, image_path: Path) -> np.ndarray:
+        """Load a preprocessed (C, H, W) float32 image, using the tensor cache.
+        
+        Cache files are memory-mapped on reuse and rebuilt when the source
+        image is newer than the cache.
+        
+        Args:
+            image_path: Path to the source image.
+            
+        Returns:
+            Preprocessed image array.
+        """
+        if self.cache_dir is not None and self._is_cached(image_path):
+            return np.load(self._cache_path(image_path), mmap_mode='r')
+        
+        image = self.processor.load_image(str(image_path))
+        image = self.processor.preprocess(image)
+        array = np.ascontiguousarray(self.processor.to_tensor(image), dtype=np.float32)
+        
+        if self.cache_dir is not None:
+            self._save_to_cache(image_path, array)
+        
+        return array
+    
+    def warm_cache_on_gpu(self, device: torch.device) -> int:
+        """Fill the tensor cache by decoding and resizing JPEGs on the GPU.
+        
+        Uses nvJPEG decoding (``torchvision.io.decode_jpeg``, one image per
+        call as batched decoding needs torchvision>=0.19) and GPU
+        bilinear resizing, following ``ImageProcessor.preprocess``: uint8
+        resize, scaling to [0, 1] and mean/std normalization. Non-JPEG
+        images and images that are already cached are left to the CPU path.
+        
+        Args:
+            device: CUDA device to decode on.
+            
+        Returns:
+            Number of images written to the cache.
+        """
+        if self.cache_dir is None or device.type != 'cuda':
+            return 0
+        
+        pending = [
+            path for path in (self.image_dir / sample['image_file'] for sample in self.samples)
+            if path.suffix.lower() in ('.jpg', '.jpeg') and not self._is_cached(path)
+        ]
+        
+        height, width = self.processor.target_size
+        mean = torch.as_tensor(self.processor.mean, device=device).view(3, 1, 1)
+        std = torch.as_tensor(self.processor.std, device=device).view(3, 1, 1)
+        
+        for path in pending:
+            image = torchvision.io.decode_jpeg(
+                torchvision.io.read_file(str(path)),
+                mode=torchvision.io.ImageReadMode.RGB,
+                device=device
+            )
+            
+            # Bilinear resize rounded back to uint8, like cv2.INTER_LINEAR
+            image = F.interpolate(
+                image.unsqueeze(0).float(), size=(height, width),
+                mode='bilinear', align_corners=False
+            ).squeeze(0).round_().clamp_(0, 255)
+            
+            if image.max() > 1.0:
+                image = image / 255.0
+            if self.processor.normalize:
+                image = (image - mean) / std
+            
+            self._save_to_cache(path, image.cpu().numpy())
+        
+        return len(pending)
+    
     def __getitem__(self, idx: int) -> tuple:
         """Get dataset item.
         
@@ -165,27 +287,37 @@ class DefectDataset(Dataset):
         sample = self.samples[idx]
         
         image_path = self.image_dir / sample['image_file']
-        image = self.processor.load_image(str(image_path))
-        image = self.processor.preprocess(image)
-        image_tensor = torch.from_numpy(self.processor.to_tensor(image)).float()
-        
-        boxes = torch.as_tensor(sample['boxes'], dtype=torch.float32)
-        labels = torch.as_tensor(sample['labels'], dtype=torch.int64)
+        image_tensor = torch.from_numpy(np.array(self._load_image_tensor(image_path)))
         
         target = {
-            'boxes': boxes,
-            'labels': labels
+            'boxes': sample['boxes'],
+            'labels': sample['labels']
         }
         
         return image_tensor, target
 
 
+def eager_state_dict(model: nn.Module) -> Dict[str, torch.Tensor]:
+    """Get a state_dict with the ``_orig_mod.`` prefixes of compiled submodules removed.
+    
+    Args:
+        model: Model whose submodules may be wrapped by ``torch.compile``.
+        
+    Returns:
+        State dict loadable into the uncompiled model.
+    """
+    return {key.replace('_orig_mod.', ''): value for key, value in model.state_dict().items()}
+
+
 def train_epoch(
     model: nn.Module,
     dataloader: DataLoader,
     optimizer: optim.Optimizer,
     device: torch.device,
-    epoch: int
+    epoch: int,
+    scaler: Optional[torch.cuda.amp.GradScaler] = None,
+    scheduler: Optional[optim.lr_scheduler.LRScheduler] = None,
+    accum_steps: int = 1
 ) -> Dict[str, float]:
     """Train for one epoch.
     
@@ -195,40 +327,78 @@ def train_epoch(
         optimizer: Optimizer.
         device: Device to train on.
         epoch: Current epoch number.
+        scaler: Gradient scaler for mixed precision. Autocast to FP16 is used
+            when it is enabled.
+        scheduler: Learning rate scheduler, stepped after each optimizer step.
+        accum_steps: Number of batches whose gradients are accumulated per
+            optimizer step.
         
     Returns:
         Dictionary of training metrics.
     """
     model.train()
     
-    total_loss = 0.0
+    use_amp = scaler is not None and scaler.is_enabled()
+    num_steps = len(dataloader)
+    
+    # Summed on the device; read back once per epoch to avoid a sync per step
+    loss_sum = torch.zeros((), device=device)
     num_batches = 0
     
+    optimizer.zero_grad(set_to_none=True)
+    
     pbar = tqdm(dataloader, desc=f"Epoch {epoch}")
     
     for images, targets in pbar:
-        images = [img.to(device) for img in images]
-        targets = [{k: v.to(device) for k, v in t.items()} for t in targets]
-        
-        loss_dict = model(images, targets)
-        losses = sum(loss for loss in loss_dict.values())
-        
-        optimizer.zero_grad()
-        losses.backward()
+        images = images_to_device(images, device)
+        targets = [{k: v.to(device, non_blocking=True) for k, v in t.items()} for t in targets]
         
-        torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
-        
-        optimizer.step()
-        
-        total_loss += losses.item()
         num_batches += 1
+        # Step every accum_steps batches and on the last (possibly short) group
+        step_now = num_batches % accum_steps == 0 or num_batches == num_steps
         
-        pbar.set_postfix({'loss': losses.item()})
+        # Under DDP, only all-reduce gradients on the batch that steps
+        sync_context = (
+            model.no_sync() if not step_now and hasattr(model, 'no_sync')
+            else contextlib.nullcontext()
+        )
         
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
+        with sync_context:
+            with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=use_amp):
+                loss_dict = model(images, targets)
+                losses = sum(loss for loss in loss_dict.values())
+            
+            if use_amp:
+                scaler.scale(losses / accum_steps).backward()
+            else:
+                (losses / accum_steps).backward()
+        
+        loss_sum += losses.detach()
+        
+        if step_now:
+            if use_amp:
+                # Unscale before clipping so the norm is measured on real gradients
+                scaler.unscale_(optimizer)
+                torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+                scaler.step(optimizer)
+                scaler.update()
+            else:
+                torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+                optimizer.step()
+            
+            optimizer.zero_grad(set_to_none=True)
+            
+            if scheduler is not None:
+                scheduler.step()
+        
+        if num_batches % 10 == 0:
+            pbar.set_postfix({'loss': losses.item()})
     
-    avg_loss = total_loss / num_batches
+    # Release cached blocks once per epoch; the allocator reuses them between batches
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    
+    avg_loss = (loss_sum / num_batches).item()
     
     return {
         'train_loss': avg_loss
@@ -238,7 +408,8 @@ def train_epoch(
 def validate(
     model: nn.Module,
     dataloader: DataLoader,
-    device: torch.device
+    device: torch.device,
+    num_classes: int
 ) -> Dict[str, float]:
     """Validate model.
     
@@ -246,25 +417,47 @@ def validate(
         model: Model to validate.
         dataloader: Validation dataloader.
         device: Device to validate on.
+        num_classes: Number of classes including background (label ids are
+            0..num_classes-1; inferring it from the labels present would
+            skip the highest id).
         
     Returns:
         Dictionary of validation metrics.
     """
     model.eval()
     
-    all_predictions = []
-    all_targets = []
+    # Flat per-box rows, built on the device and copied to the host once:
+    # [image_idx, x1, y1, x2, y2, score, label] for predictions and
+    # [image_idx, x1, y1, x2, y2, label] for ground truth
+    pred_chunks = []
+    gt_chunks = []
+    image_idx = 0
     
-    with torch.no_grad():
+    with torch.inference_mode(), torch.autocast(
+        device_type=device.type, dtype=torch.float16, enabled=device.type == 'cuda'
+    ):
         for images, targets in tqdm(dataloader, desc="Validating"):
-            images = [img.to(device) for img in images]
-            
-            predictions = model(images)
+            images = images_to_device(images, device)
             
-            all_predictions.extend(predictions)
-            all_targets.extend(targets)
+            for pred, target in zip(model(images), targets):
+                # Box regression can come out of autocast as FP16; keep metrics in FP32
+                pred_chunks.append(torch.cat([
+                    torch.full((len(pred['boxes']), 1), image_idx, dtype=torch.float32, device=device),
+                    pred['boxes'].float(),
+                    pred['scores'].float().unsqueeze(1),
+                    pred['labels'].float().unsqueeze(1)
+                ], dim=1))
+                gt_chunks.append(torch.cat([
+                    torch.full((len(target['boxes']), 1), image_idx, dtype=torch.float32),
+                    target['boxes'].float(),
+                    target['labels'].float().unsqueeze(1)
+                ], dim=1))
+                image_idx += 1
+    
+    pred_all = torch.cat(pred_chunks).cpu().numpy() if pred_chunks else np.empty((0, 7), dtype=np.float32)
+    gt_all = torch.cat(gt_chunks).numpy() if gt_chunks else np.empty((0, 6), dtype=np.float32)
     
-    map_score = calculate_map(all_predictions, all_targets, iou_threshold=0.5)
+    map_score = calculate_map_arrays(pred_all, gt_all, iou_threshold=0.5, num_classes=num_classes)
     
     return {
         'val_mAP@0.5': map_score
@@ -277,23 +470,43 @@ def train_model(
 ) -> None:
     """Main training function with MLflow tracking.
     
+    When a process group is initialized (launched with ``torchrun``), the model
+    is wrapped in DistributedDataParallel and the training set is sharded with
+    a DistributedSampler. Validation, logging and checkpointing run on rank 0.
+    The learning rate follows a one-cycle schedule stepped every optimizer step.
+    
     Args:
         config: Training configuration dictionary.
         device: Device to train on.
     """
-    mlflow.set_tracking_uri(config['mlflow_tracking_uri'])
-    mlflow.set_experiment(config['experiment_name'])
-    
-    with mlflow.start_run(run_name=f"train_{datetime.now().strftime('%Y%m%d_%H%M%S')}"):
-        mlflow.log_params({
-            'num_epochs': config['num_epochs'],
-            'batch_size': config['batch_size'],
-            'learning_rate': config['learning_rate'],
-            'num_classes': config['num_classes'],
-            'image_size': config['image_size'],
-            'device': str(device),
-            'gpu_name': torch.cuda.get_device_name(device) if torch.cuda.is_available() else 'CPU'
-        })
+    distributed = dist.is_available() and dist.is_initialized()
+    is_main = not distributed or dist.get_rank() == 0
+    
+    # Effective batch is batch_size * accum_steps (per process)
+    accum_steps = config.get('gpu_optimization', {}).get('gradient_accumulation_steps', 1)
+    
+    if is_main:
+        mlflow.set_tracking_uri(config['mlflow_tracking_uri'])
+        mlflow.set_experiment(config['experiment_name'])
+    
+    run = (
+        mlflow.start_run(run_name=f"train_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        if is_main else contextlib.nullcontext()
+    )
+    
+    with run:
+        if is_main:
+            mlflow.log_params({
+                'num_epochs': config['num_epochs'],
+                'batch_size': config['batch_size'],
+                'learning_rate': config['learning_rate'],
+                'num_classes': config['num_classes'],
+                'image_size': config['image_size'],
+                'device': str(device),
+                'gpu_name': torch.cuda.get_device_name(device) if torch.cuda.is_available() else 'CPU',
+                'world_size': dist.get_world_size() if distributed else 1,
+                'accum_steps': accum_steps
+            })
         
         logger.info("Initializing model...")
         detector = DefectDetector(
@@ -303,33 +516,90 @@ def train_model(
         model = detector.model  # Get the actual PyTorch model
         model.to(device)
         
+        # NHWC conv weights for tensor-core kernels; cuDNN then runs the
+        # backbone/FPN convs channels-last even though GeneralizedRCNNTransform
+        # re-batches the inputs as NCHW
+        if device.type == 'cuda':
+            model.to(memory_format=torch.channels_last)
+        
+        # Compile the backbone (checkpoints drop the resulting "_orig_mod."
+        # key prefix, see eager_state_dict). The RPN/ROI heads have
+        # data-dependent shapes and stay eager; Triton is not available on
+        # Windows.
+        if device.type == 'cuda' and sys.platform != 'win32' and config.get('compile', True):
+            logger.info("Compiling backbone with torch.compile...")
+            model.backbone = torch.compile(model.backbone, dynamic=True)
+        
+        # Training steps go through the DDP wrapper; validation and
+        # checkpoints use the underlying model. static_graph does not
+        # support the no_sync() used for gradient accumulation.
+        if distributed:
+            train_net = DDP(
+                model,
+                device_ids=[device.index] if device.type == 'cuda' else None,
+                gradient_as_bucket_view=True,
+                static_graph=accum_steps == 1
+            )
+        else:
+            train_net = model
+        
         logger.info("Loading datasets...")
         processor = ImageProcessor(target_size=config['image_size'])
         
+        # Preprocessed tensors are cached under <image_dir>/.cache unless disabled
+        use_cache = config.get('use_cache', True)
+        
         train_dataset = DefectDataset(
             config['train_image_dir'],
             config['train_annotations'],
             processor,
-            augment=True
+            augment=True,
+            cache_dir=Path(config['train_image_dir']) / '.cache' if use_cache else None
         )
         
         val_dataset = DefectDataset(
             config['val_image_dir'],
             config['val_annotations'],
             processor,
-            augment=False
+            augment=False,
+            cache_dir=Path(config['val_image_dir']) / '.cache' if use_cache else None
         )
         
+        # Decode/resize JPEGs with nvJPEG into the tensor cache up front, so
+        # loader workers only memory-map preprocessed arrays
+        if use_cache and device.type == 'cuda' and config.get('gpu_decode', True):
+            if is_main:
+                for dataset in (train_dataset, val_dataset):
+                    num_cached = dataset.warm_cache_on_gpu(device)
+                    logger.info(f"Cached {num_cached} images from {dataset.image_dir} on GPU")
+            if distributed:
+                dist.barrier()
+        
         # Use num_workers=0 on Windows to avoid multiprocessing issues
-        num_workers = 0 if sys.platform == 'win32' else config.get('num_workers', 4)
+        num_workers = 0 if sys.platform == 'win32' else config.get('num_workers', min(8, os.cpu_count() or 1))
+        
+        # Page-locked host batches only help copies to a CUDA device
+        pin_memory = device.type == 'cuda'
+        
+        # Keep workers (and their parsed datasets) alive across epochs and
+        # queue more batches ahead of the GPU
+        worker_kwargs = {
+            'persistent_workers': True,
+            'prefetch_factor': 4
+        } if num_workers > 0 else {}
+        
+        # Each rank trains on its own shard; the sampler does the shuffling
+        train_sampler = DistributedSampler(train_dataset, shuffle=True) if distributed else None
         
         train_loader = DataLoader(
             train_dataset,
             batch_size=config['batch_size'],
-            shuffle=True,
+            shuffle=train_sampler is None,
+            sampler=train_sampler,
             num_workers=num_workers,
-            pin_memory=True if torch.cuda.is_available() else False,
-            collate_fn=collate_fn
+            pin_memory=pin_memory,
+            collate_fn=collate_fn,
+            **worker_kwargs
         )
         
         val_loader = DataLoader(
@@ -337,71 +607,96 @@ def train_model(
             batch_size=config['batch_size'],
             shuffle=False,
             num_workers=num_workers,
-            pin_memory=True if torch.cuda.is_available() else False,
-            collate_fn=collate_fn
+            pin_memory=pin_memory,
+            collate_fn=collate_fn,
+            **worker_kwargs
         )
         
         logger.info("Setting up optimizer and scheduler...")
         optimizer = optim.AdamW(
             model.parameters(),
             lr=config['learning_rate'],
-            weight_decay=config['weight_decay']
+            weight_decay=config['weight_decay'],
+            fused=device.type == 'cuda'  # single multi-tensor kernel per step on GPU
         )
         
-        scheduler = optim.lr_scheduler.ReduceLROnPlateau(
+        # Warm up to the configured rate, then anneal; stepped every optimizer step
+        scheduler = optim.lr_scheduler.OneCycleLR(
             optimizer,
-            mode='max',
-            factor=0.5,
-            patience=3
+            max_lr=config['learning_rate'],
+            steps_per_epoch=math.ceil(len(train_loader) / accum_steps),
+            epochs=config['num_epochs']
         )
         
+        # Mixed precision on GPU (FP16 autocast on tensor cores)
+        scaler = torch.cuda.amp.GradScaler(enabled=device.type == 'cuda')
+        
         best_map = 0.0
         
         logger.info("Starting training...")
         for epoch in range(1, config['num_epochs'] + 1):
             logger.info(f"Epoch {epoch}/{config['num_epochs']}")
             
-            train_metrics = train_epoch(model, train_loader, optimizer, device, epoch)
+            if train_sampler is not None:
+                train_sampler.set_epoch(epoch)
             
-            mlflow.log_metrics(train_metrics, step=epoch)
-            logger.info(f"Train Loss: {train_metrics['train_loss']:.4f}")
+            train_metrics = train_epoch(
+                train_net, train_loader, optimizer, device, epoch, scaler, scheduler, accum_steps
+            )
             
-            val_metrics = validate(model, val_loader, device)
+            if is_main:
+                mlflow.log_metrics(train_metrics, step=epoch)
+                logger.info(f"Train Loss: {train_metrics['train_loss']:.4f}")
+            
+            # Validation and checkpoints on rank 0 only
+            if not is_main:
+                continue
+            
+            val_metrics = validate(model, val_loader, device, config['num_classes'])
             
             mlflow.log_metrics(val_metrics, step=epoch)
             logger.info(f"Validation mAP@0.5: {val_metrics['val_mAP@0.5']:.4f}")
             
-            scheduler.step(val_metrics['val_mAP@0.5'])
-            
             if val_metrics['val_mAP@0.5'] > best_map:
                 best_map = val_metrics['val_mAP@0.5']
                 
                 checkpoint_path = Path(config['checkpoint_dir']) / 'best_model.pth'
                 checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
                 
+                # Write then rename so an interrupted save never leaves a
+                # truncated best_model.pth behind
+                tmp_path = checkpoint_path.with_suffix('.tmp')
                 torch.save({
                     'epoch': epoch,
-                    'model_state_dict': model.state_dict(),
+                    'model_state_dict': eager_state_dict(model),
                     'optimizer_state_dict': optimizer.state_dict(),
                     'best_map': best_map,
                     'config': config
-                }, checkpoint_path)
+                }, tmp_path)
+                os.replace(tmp_path, checkpoint_path)
                 
                 mlflow.log_artifact(str(checkpoint_path))
                 logger.info(f"Saved best model with mAP@0.5: {best_map:.4f}")
         
-        mlflow.log_metric('best_val_mAP@0.5', best_map)
-        
-        mlflow.pytorch.log_model(model.model, "model")
+        if is_main:
+            mlflow.log_metric('best_val_mAP@0.5', best_map)
+            
+            mlflow.pytorch.log_model(model.model, "model")
         
         logger.info("Training completed!")
 
 
 def main():
-    """Main entry point."""
+    """Main entry point.
+    
+    Run directly for single-GPU training, or through ``torchrun`` for
+    DistributedDataParallel across ``--nproc_per_node`` GPUs::
+    
+        torchrun --nproc_per_node=2 scripts/train.py --config configs/train_config.json
+    """
     parser = argparse.ArgumentParser(description="Train defect detection model on RTX 4050")
     parser.add_argument('--config', type=str, default='configs/train_config.json', help='Path to config file')
-    parser.add_argument('--gpu', type=int, default=0, help='GPU device ID')
+    parser.add_argument('--gpu', type=int, default=0, help='GPU device ID (ignored under torchrun)')
     args = parser.parse_args()
     
     import json
@@ -410,9 +705,23 @@ def main():
     
     optimize_for_rtx4050()
     
-    device = setup_gpu(args.gpu)
+    # torchrun sets LOCAL_RANK; each process then drives one GPU
+    local_rank = os.environ.get('LOCAL_RANK')
+    if local_rank is not None:
+        gpu_id = int(local_rank)
+        if torch.cuda.is_available():
+            torch.cuda.set_device(gpu_id)
+        dist.init_process_group('nccl' if torch.cuda.is_available() else 'gloo')
+    else:
+        gpu_id = args.gpu
+    
+    device = setup_gpu(gpu_id)
     
-    train_model(config, device)
+    try:
+        train_model(config, device)
+    finally:
+        if dist.is_initialized():
+            dist.destroy_process_group()
 
 
 if __name__ == "__main__":
@@ -13,11 +13,68 @@ Your data structure (Difetto1/, Difetto2/, etc.) is perfect for classification!
 
 import os
 import sys
+import json
 from pathlib import Path
 from datetime import datetime
 import torch
 
 
+SPLITS = ('training', 'validation', 'testing')
+COUNTS_CACHE = '.counts.json'
+
+
+def split_image_counts(data_path: Path) -> dict:
+    """
+    Count images and classes per split, cached in ``data_path/.counts.json``.
+    
+    The cache is keyed by the modification times of the split and class
+    directories, so adding or removing images (or classes) triggers a rescan
+    of that split only.
+    
+    Returns:
+        Dict of split name -> (num_images, num_classes) for existing splits
+    """
+    cache_file = data_path / COUNTS_CACHE
+    try:
+        cache = json.loads(cache_file.read_text())
+    except (FileNotFoundError, ValueError):
+        cache = {}
+    
+    counts = {}
+    changed = False
+    for split in SPLITS:
+        split_path = data_path / split
+        if not split_path.is_dir():
+            continue
+        
+        class_dirs = [entry for entry in os.scandir(split_path) if entry.is_dir()]
+        # Lists (not tuples) so the stamp compares equal after a JSON round trip
+        stamp = [split_path.stat().st_mtime] + sorted(
+            [entry.name, entry.stat().st_mtime] for entry in class_dirs
+        )
+        
+        entry = cache.get(split)
+        if entry is None or entry['stamp'] != stamp:
+            num_images = sum(
+                1
+                for class_dir in class_dirs
+                for image in os.scandir(class_dir.path)
+                if image.name.endswith(('.png', '.jpg'))
+            )
+            entry = cache[split] = {'stamp': stamp, 'images': num_images, 'classes': len(class_dirs)}
+            changed = True
+        
+        counts[split] = (entry['images'], entry['classes'])
+    
+    if changed:
+        try:
+            cache_file.write_text(json.dumps(cache))
+        except OSError:
+            pass  # read-only dataset; just rescan next time
+    
+    return counts
+
+
 def train_classification_model(
     data_dir: str = "../DATA",
     model_size: str = 's',
@@ -75,7 +132,6 @@ def train_classification_model(
         
         # Based on your distribution:
         # LP: 4962, PO: 4108, CR: 2893, ND: 3900
-        total = 4962 + 4108 + 2893 + 3900
         
         # Higher weight = more important
         weights = {
@@ -104,14 +160,8 @@ def train_classification_model(
         return
     
     print("📁 Data Structure:")
-    for split in ['training', 'validation', 'testing']:
-        split_path = data_path / split
-        if split_path.exists():
-            classes = [d.name for d in split_path.iterdir() if d.is_dir()]
-            total_images = sum(len(list((split_path / c).glob('*.png'))) + 
-                              len(list((split_path / c).glob('*.jpg'))) 
-                              for c in classes)
-            print(f"   {split:12s}: {total_images:5d} images in {len(classes)} classes")
+    for split, (num_images, num_classes) in split_image_counts(data_path).items():
+        print(f"   {split:12s}: {num_images:5d} images in {num_classes} classes")
     print()
     
     # Training parameters
@@ -226,27 +276,34 @@ def train_classification_model(
     print("      python scripts/evaluate_classification_confidence.py")
     print()
     
-    # Test on a sample image
-    print("🔍 Testing on sample image...")
+    # Test on one sample image per class, predicted as a single batch
+    print("🔍 Testing on sample images...")
     test_classes = ['Difetto1', 'Difetto2', 'Difetto4', 'NoDifetto']
+    samples = []
     for test_class in test_classes:
         test_dir = data_path / 'testing' / test_class
-        if test_dir.exists():
-            test_images = list(test_dir.glob('*.png')) + list(test_dir.glob('*.jpg'))
-            if test_images:
-                test_img = test_images[0]
-                print(f"\n   Testing {test_class} sample: {test_img.name}")
-                result = model.predict(test_img, verbose=False)[0]
-                if hasattr(result, 'probs'):
-                    top_class = result.names[int(result.probs.top1)]
-                    confidence = float(result.probs.top1conf)
-                    print(f"      Predicted: {top_class} (confidence: {confidence:.4f})")
-                    
-                    # Show all class probabilities
-                    print(f"      All probabilities:")
-                    for i, prob in enumerate(result.probs.data):
-                        print(f"         {result.names[i]}: {float(prob):.4f}")
-                break
+        if test_dir.is_dir():
+            test_img = next(
+                (p for p in sorted(test_dir.iterdir()) if p.suffix in ('.png', '.jpg')), None
+            )
+            if test_img is not None:
+                samples.append((test_class, test_img))
+    
+    if samples:
+        results_batch = model.predict(
+            [str(test_img) for _, test_img in samples], verbose=False, batch=len(samples)
+        )
+        for (test_class, test_img), result in zip(samples, results_batch):
+            print(f"\n   Testing {test_class} sample: {test_img.name}")
+            if hasattr(result, 'probs'):
+                top_class = result.names[int(result.probs.top1)]
+                confidence = float(result.probs.top1conf)
+                print(f"      Predicted: {top_class} (confidence: {confidence:.4f})")
+                
+                # Show all class probabilities
+                print(f"      All probabilities:")
+                for i, prob in enumerate(result.probs.data.tolist()):
+                    print(f"         {result.names[i]}: {prob:.4f}")
     
     print()
     return results
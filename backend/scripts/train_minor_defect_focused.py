@@ -12,47 +12,148 @@ misclassified as "No Defect" by:
 
 import os
 import sys
+import math
+import functools
 from pathlib import Path
-import yaml
 from datetime import datetime
 import torch
 import numpy as np
 
-def create_class_weighted_config(data_yaml_path: str, output_path: str = None):
+from _training import (
+    choose_cache_mode, load_yaml, parse_devices, patched_trainer,
+    save_slim_checkpoints, to_channels_last,
+)
+from _weights import weights_path
+
+# Training distribution:
+# Difetto1 (LP): 4962 (31.3%)
+# Difetto2 (PO): 4108 (25.9%)
+# Difetto4 (CR): 2893 (18.2%) <- Underrepresented
+# NoDifetto (ND): 3900 (24.6%)
+CLASS_COUNTS = torch.tensor([4962.0, 4108.0, 2893.0, 3900.0])
+
+# Inverse frequency weights; boost CR more (underrepresented) and penalize ND
+# less (we care more about defects), normalized to average 1.0
+CLASS_WEIGHTS = CLASS_COUNTS.sum() / (4 * CLASS_COUNTS) * torch.tensor([1.0, 1.0, 1.5, 0.5])
+CLASS_WEIGHTS = CLASS_WEIGHTS / CLASS_WEIGHTS.sum() * 4
+
+
+def focal_bce(
+    pred: torch.Tensor,
+    label: torch.Tensor,
+    gamma: float,
+    alpha: float,
+    pos_weight: torch.Tensor = None,
+) -> torch.Tensor:
+    """Element-wise sigmoid focal loss (drop-in for BCEWithLogitsLoss(reduction='none'))"""
+    loss = torch.nn.functional.binary_cross_entropy_with_logits(
+        pred, label, reduction='none', pos_weight=pos_weight
+    )
+    pred_prob = pred.sigmoid()
+    p_t = label * pred_prob + (1 - label) * (1 - pred_prob)
+    alpha_t = label * alpha + (1 - label) * (1 - alpha)
+    return loss * alpha_t * (1.0 - p_t) ** gamma
+
+
+class FocalBCE(torch.nn.Module):
+    """Focal loss module that fuses focal_bce into one kernel when Triton is available"""
+    
+    def __init__(self, gamma: float = 2.0, alpha: float = 0.25, pos_weight: torch.Tensor = None):
+        super().__init__()
+        self.gamma = gamma
+        self.alpha = alpha
+        self.pos_weight = pos_weight
+        # Triton (needed by torch.compile on GPU) is not available on Windows
+        if torch.cuda.is_available() and sys.platform != 'win32':
+            self.fn = torch.compile(focal_bce, dynamic=True)
+        else:
+            self.fn = focal_bce
+    
+    def forward(self, pred: torch.Tensor, label: torch.Tensor) -> torch.Tensor:
+        # Move the per-class weights once, not on every call
+        if self.pos_weight is not None and (
+            self.pos_weight.device != pred.device or self.pos_weight.dtype != pred.dtype
+        ):
+            self.pos_weight = self.pos_weight.to(device=pred.device, dtype=pred.dtype)
+        return self.fn(pred, label, self.gamma, self.alpha, self.pos_weight)
+
+
+def patch_focal_loss(gamma: float = 2.0, alpha: float = 0.25, class_weights: torch.Tensor = None):
+    """
+    Swap the BCE classification term of v8DetectionLoss for FocalBCE.
+    
+    class_weights (one per class) become the positive-class weights of the
+    BCE term; they are ignored if the model has a different number of classes.
+    """
+    from ultralytics.utils.loss import v8DetectionLoss
+    
+    original_init = getattr(v8DetectionLoss, '_radikal_original_init', v8DetectionLoss.__init__)
+    def patched_init(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        # Kept apart from self.class_weights, which ultralytics multiplies
+        # into the BCE loss itself (on the model's device)
+        pos_weight = class_weights if class_weights is not None and len(class_weights) == self.nc else None
+        self.bce = FocalBCE(gamma=gamma, alpha=alpha, pos_weight=pos_weight)
+    
+    v8DetectionLoss.__init__ = patched_init
+    v8DetectionLoss._radikal_original_init = original_init
+
+
+def export_int8(weights: str, data_yaml: str, img_size: int = 640):
     """
-    Create a modified data.yaml with class weights that penalize
-    missing defects (false negatives) more than false positives.
+    Export an INT8 deployment model calibrated on the validation set.
+    
+    TensorRT engine on CUDA, OpenVINO otherwise (ultralytics ignores int8
+    for ONNX). Returns the exported path, or None if the export failed.
     """
+    from ultralytics import YOLO
     
-    with open(data_yaml_path, 'r') as f:
-        config = yaml.safe_load(f)
+    formats = ['engine', 'openvino'] if torch.cuda.is_available() else ['openvino']
+    for fmt in formats:
+        print(f"⚙️  Exporting INT8 {fmt} model (calibrating on validation set)...")
+        try:
+            extra = {'workspace': 4} if fmt == 'engine' else {}
+            return YOLO(weights).export(format=fmt, int8=True, data=data_yaml, imgsz=img_size, **extra)
+        except Exception as e:
+            print(f"⚠️  INT8 {fmt} export failed: {e}")
+    return None
+
+
+def record_seed(save_dir: Path, seed: int, deterministic: bool):
+    """Write the seed and git commit of a run to save_dir/seed.txt"""
+    import subprocess
+    
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = 'unknown'
     
-    # Calculate class weights based on distribution
-    # Training distribution:
-    # Difetto1 (LP): 4962 (31.3%)
-    # Difetto2 (PO): 4108 (25.9%)
-    # Difetto4 (CR): 2893 (18.2%) <- Underrepresented
-    # NoDifetto (ND): 3900 (24.6%)
+    seed_file = Path(save_dir) / 'seed.txt'
+    seed_file.write_text(f"seed: {seed}\ndeterministic: {deterministic}\ngit: {commit}\n")
+    return seed_file
+
+
+def create_class_weighted_config(data_yaml_path: str, output_path: str = None):
+    """
+    Report the class weights (CLASS_WEIGHTS) that penalize missing
+    defects (false negatives) more than false positives.
     
-    total = 4962 + 4108 + 2893 + 3900
+    Returns:
+        CLASS_WEIGHTS, a float32 tensor of shape (num_classes,) usable as
+        BCEWithLogitsLoss(pos_weight=...)
+    """
     
-    # Calculate inverse frequency weights
-    weights = {
-        0: total / (4 * 4962),  # LP - Difetto1
-        1: total / (4 * 4108),  # PO - Difetto2
-        2: total / (4 * 2893) * 1.5,  # CR - Difetto4 (boost more - underrepresented)
-        3: total / (4 * 3900) * 0.5,  # ND - NoDifetto (penalize less - we care more about defects)
-    }
+    config = load_yaml(str(data_yaml_path))
     
-    # Normalize weights
-    weight_sum = sum(weights.values())
-    weights = {k: v/weight_sum * 4 for k, v in weights.items()}
+    weights = CLASS_WEIGHTS.tolist()
     
     print("📊 Class Weights (Higher = More Important):")
     for class_id, name in config['names'].items():
         print(f"   {name:15s} → Weight: {weights[class_id]:.3f}")
     
-    return weights
+    return CLASS_WEIGHTS
 
 
 def train_improved_model(
@@ -62,14 +163,30 @@ def train_improved_model(
     batch_size: int = 16,
     img_size: int = 640,
     device: str = '0',
+    gamma: float = 2.0,
+    alpha: float = 0.25,
+    val_every: int = 5,
+    deterministic: bool = False,
+    sync_bn: bool = False,
+    int8_export: bool = True,
+    seed: int = 42,
 ):
     """
     Train YOLOv8 with optimizations for minor defect detection.
+    
+    gamma/alpha configure the focal loss that replaces the plain BCE
+    classification loss (gamma=0, alpha=0.5 is BCE scaled by 0.5).
+    val_every validates every N epochs; the final epoch and any epoch where
+    early stopping could trigger are always validated.
+    deterministic=True trades cuDNN autotuning for reproducible runs; the
+    seed and git commit are written to seed.txt in the run directory either way.
+    device may be a comma list ('0,1') for DDP; batch_size is then per GPU
+    and lr0 is scaled by sqrt(num_gpus). sync_bn syncs BatchNorm across GPUs.
+    int8_export builds an INT8-calibrated deployment model from best.pt.
     """
     
     try:
         from ultralytics import YOLO
-        from ultralytics.utils.loss import v8DetectionLoss
     except ImportError:
         print("❌ Ultralytics not installed!")
         return
@@ -79,6 +196,8 @@ def train_improved_model(
         print("⚠️ CUDA not available, switching to CPU")
         device = 'cpu'
     
+    device, num_gpus = parse_devices(device)
+    
     print("=" * 80)
     print("🎯 Training YOLOv8 for Minor Defect Detection")
     print("=" * 80)
@@ -87,23 +206,63 @@ def train_improved_model(
     print(f"   Focus: High recall for defect classes (LP, PO, CR)")
     print(f"   Strategy: Class weighting + Enhanced augmentation")
     print(f"   Epochs: {epochs}")
-    print(f"   Batch Size: {batch_size}")
+    print(f"   Batch Size: {batch_size}" + (f" per GPU x {num_gpus}" if num_gpus > 1 else ""))
     print(f"   Image Size: {img_size}")
-    print(f"   Device: {'GPU' if device != 'cpu' else 'CPU'}")
+    print(f"   Device: {'CPU' if device == 'cpu' else f'GPU {device}'}")
     print()
     
     # Calculate class weights
     print("🔧 Calculating Class Weights...")
-    weights = create_class_weighted_config(data_yaml)
+    class_weights = create_class_weighted_config(data_yaml)
     print()
     
+    # Let cuDNN pick the fastest conv kernels (unless reproducibility was
+    # requested) and allow TF32 for float32 matmuls/convs (AMP below covers
+    # the FP16 tensor-core path)
+    if torch.cuda.is_available():
+        torch.backends.cudnn.benchmark = not deterministic
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+    
+    # Focal loss for hard examples (down-weights easy, well-classified anchors)
+    # with the class weights applied to the positive (class present) term.
+    # The trainer applies it, along with persistent/prefetching dataloader
+    # workers, in the training process (every worker under DDP)
+    focal_loss = functools.partial(patch_focal_loss, gamma=gamma, alpha=alpha, class_weights=class_weights)
+    
+    # Decode images once instead of every epoch
+    cache_mode = choose_cache_mode(data_yaml, imgsz=img_size)
+    print(f"💾 Image Cache: {cache_mode}")
+    
+    # Compile the network (CUDA graphs for the fixed 640x640 shape); the
+    # trainer rebuilds the model, so use its compile option rather than
+    # wrapping model.model. Triton is not available on Windows.
+    compile_mode = 'reduce-overhead' if torch.cuda.is_available() and sys.platform != 'win32' else False
+    
     # Load pre-trained model
-    model_name = f'yolov8{model_size}.pt'
+    model_name = weights_path(model_size)
     print(f"📥 Loading pre-trained model: {model_name}")
     model = YOLO(model_name)
     print(f"✅ Model loaded!")
     print()
     
+    # The trainer rebuilds the network, so switch its model (not ours) to
+    # channels-last once setup is done
+    if torch.cuda.is_available():
+        model.add_callback('on_pretrain_routine_end', to_channels_last)
+    
+    # Validate every val_every epochs. Clearing fitness on skipped epochs
+    # keeps best.pt and the early-stopping counter tied to real validations
+    # (patience is still counted in epochs)
+    def schedule_validation(trainer):
+        trainer.args.val = (trainer.epoch + 1) % val_every == 0
+        if not trainer.args.val:
+            trainer.fitness = None
+    model.add_callback('on_train_epoch_end', schedule_validation)
+    
+    # Periodic (save_period) checkpoints hold weights only
+    save_slim_checkpoints(model)
+    
     # Enhanced hyperparameters for minor defect detection
     print("=" * 80)
     print("🏋️ Starting Training with Minor Defect Focus...")
@@ -112,7 +271,7 @@ def train_improved_model(
     print("   • Lower confidence threshold (0.1 vs 0.25 default)")
     print("   • Class weighting (defects 2-3x more important)")
     print("   • Enhanced augmentation (mixup, copy-paste)")
-    print("   • Focal loss parameters (harder examples)")
+    print(f"   • Focal loss (gamma={gamma}, alpha={alpha}) for harder examples")
     print("   • Higher patience (allow longer convergence)")
     print()
     
@@ -120,9 +279,10 @@ def train_improved_model(
     
     # Train with optimized parameters
     results = model.train(
+        trainer=patched_trainer(model, sync_bn=sync_bn and num_gpus > 1, patches=[focal_loss]),
         data=data_yaml,
         epochs=epochs,
-        batch=batch_size,
+        batch=batch_size * num_gpus,  # ultralytics splits the batch across GPUs
         imgsz=img_size,
         device=device,
         project='models/yolo',
@@ -135,7 +295,7 @@ def train_improved_model(
         
         # Optimization
         optimizer='AdamW',
-        lr0=0.001,  # Lower initial learning rate for fine-tuning
+        lr0=0.001 * math.sqrt(num_gpus),  # Lower initial learning rate for fine-tuning
         lrf=0.001,  # Very low final LR for convergence
         momentum=0.937,
         weight_decay=0.001,  # Slightly higher for regularization
@@ -166,6 +326,8 @@ def train_improved_model(
         fliplr=0.5,   # Horizontal flip OK
         mosaic=1.0,   # Mosaic augmentation
         mixup=0.15,   # Mixup for blending (helps with unclear defects!)
+        # Copy-paste pastes segment masks from the same (already decoded)
+        # image; it is skipped for box-only labels
         copy_paste=0.3,  # Copy-paste augmentation (great for rare defects!)
         
         # Additional augmentations
@@ -187,16 +349,21 @@ def train_improved_model(
         plots=True,
         
         # Performance
-        workers=4,
+        workers=min(os.cpu_count(), 12),
+        cache=cache_mode,  # Decoded images in RAM if they fit, else disk
+        amp=True,  # Mixed precision (FP16 autocast)
+        compile=compile_mode,
         verbose=True,
         
-        # Reproducibility
-        seed=42,
-        deterministic=True,
+        # Reproducibility (same seed -> same init and data order; bitwise
+        # repeatable runs additionally need deterministic=True)
+        seed=seed,
+        deterministic=deterministic,
     )
     
     end_time = datetime.now()
     duration = end_time - start_time
+    seed_file = record_seed(model.trainer.save_dir, seed, deterministic)
     
     print()
     print("=" * 80)
@@ -204,6 +371,7 @@ def train_improved_model(
     print("=" * 80)
     print(f"   Duration: {duration}")
     print(f"   Best Model: models/yolo/minor_defect_focused/weights/best.pt")
+    print(f"   Seed: {seed} (recorded in {seed_file})")
     print()
     
     # Validate with low confidence threshold
@@ -217,6 +385,13 @@ def train_improved_model(
     print(f"   mAP@0.5:   {metrics.results_dict.get('metrics/mAP50(B)', 0):.4f}")
     print()
     
+    # INT8 deployment model next to best.pt
+    if int8_export:
+        int8_path = export_int8(str(model.trainer.best), data_yaml, img_size=img_size)
+        if int8_path:
+            print(f"   INT8 Model: {int8_path}")
+        print()
+    
     print("💡 Next Steps:")
     print("   1. Compare recall with previous model (should be higher!)")
     print("   2. Check confusion matrix for No Defect misclassifications")
@@ -244,7 +419,19 @@ def main():
     parser.add_argument('--img', type=int, default=640,
                         help='Image size')
     parser.add_argument('--device', type=str, default='0',
-                        help='GPU device or cpu')
+                        help='GPU device(s), e.g. 0 or 0,1 for multi-GPU DDP, or cpu')
+    parser.add_argument('--sync-bn', action='store_true',
+                        help='Synchronize BatchNorm statistics across GPUs (multi-GPU only)')
+    parser.add_argument('--no-int8-export', action='store_true',
+                        help='Skip exporting the INT8 deployment model after training')
+    parser.add_argument('--gamma', type=float, default=2.0,
+                        help='Focal loss focusing parameter')
+    parser.add_argument('--alpha', type=float, default=0.25,
+                        help='Focal loss positive-class weight')
+    parser.add_argument('--val-every', type=int, default=5,
+                        help='Validate every N epochs')
+    parser.add_argument('--deterministic', action='store_true',
+                        help='Reproducible training (disables cuDNN autotuning, slower)')
     
     args = parser.parse_args()
     
@@ -268,7 +455,13 @@ def main():
         epochs=args.epochs,
         batch_size=args.batch,
         img_size=args.img,
-        device=args.device
+        device=args.device,
+        gamma=args.gamma,
+        alpha=args.alpha,
+        val_every=args.val_every,
+        deterministic=args.deterministic,
+        sync_bn=args.sync_bn,
+        int8_export=not args.no_int8_export,
     )
 
 
@@ -6,6 +6,9 @@ import os
 import sys
 import warnings
 
+from _training import patch_dataloaders, save_slim_checkpoints, to_channels_last
+from _weights import weights_path
+
 # Critical: Disable ALL online operations
 os.environ['YOLO_OFFLINE'] = '1'
 os.environ['YOLO_VERBOSE'] = 'False'
@@ -36,7 +39,7 @@ def train_offline():
     
     # Config
     data_yaml = 'models/yolo/riawelc.yaml'
-    model_path = os.path.expanduser('~/.cache/yolov8s.pt')
+    model_path = weights_path('s')
     
     print(f"\n📊 Configuration:")
     print(f"   Model: {model_path}")
@@ -45,12 +48,33 @@ def train_offline():
     print(f"   Batch: 16" if has_cuda else "   Batch: 4")
     print(f"   Device: {device}")
     
+    # Let cuDNN pick the fastest conv kernels and allow TF32 for float32
+    # matmuls/convs (AMP below covers the FP16 tensor-core path)
+    if has_cuda:
+        torch.backends.cudnn.benchmark = True
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+    
+    # Compile the network (CUDA graphs for the fixed 640x640 shape); the
+    # trainer rebuilds the model, so use its compile option rather than
+    # wrapping model.model. Triton is not available on Windows.
+    compile_mode = 'reduce-overhead' if has_cuda and sys.platform != 'win32' else False
+    
     # Load model
     print(f"\n📥 Loading model...")
     model = YOLO(model_path)
     params = sum(p.numel() for p in model.model.parameters())
     print(f"✅ Model loaded ({params:,} parameters)")
     
+    # The trainer rebuilds the network, so switch its model (not ours) and
+    # its input batches to channels-last once setup is done
+    if has_cuda:
+        model.add_callback('on_pretrain_routine_end', to_channels_last)
+    
+    # Periodic (save_period) checkpoints hold FP16 EMA weights only; last.pt
+    # keeps the full state (optimizer included) for resuming
+    save_slim_checkpoints(model)
+    
     # Train with minimal online operations
     print("\n🏋️ Starting training (offline mode)...")
     print("=" * 60)
@@ -63,6 +87,10 @@ def train_offline():
             pass  # Skip font check
         checks.check_font = no_font_check
         
+        # Keep dataloader workers alive and prefetching between epochs,
+        # with pinned host memory for faster host-to-GPU copies
+        patch_dataloaders()
+        
         results = model.train(
             data=data_yaml,
             epochs=50,
@@ -76,9 +104,11 @@ def train_offline():
             save_period=5,
             verbose=True,
             plots=True,
-            # Disable online operations
-            cache=False,
+            cache='disk',  # Decode once into .npy files, reused every epoch
             exist_ok=True,
+            workers=min(os.cpu_count(), 12),
+            amp=True,  # Mixed precision (FP16 autocast)
+            compile=compile_mode,
         )
         
         print("\n" + "=" * 60)
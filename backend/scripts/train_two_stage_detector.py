@@ -15,12 +15,59 @@ Benefits:
 
 import os
 import sys
+import math
+import multiprocessing
+import subprocess
 from pathlib import Path
 import yaml
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import torch
 
+from _training import (
+    SafeDumper, choose_cache_mode, load_yaml, parse_devices, patched_trainer,
+    to_channels_last,
+)
+from _weights import weights_path
+
+
+def link_image(src: Path, dest: Path):
+    """
+    Hardlink src to dest (symlink across filesystems) instead of copying.
+    
+    Existing destinations are left alone so datasets can be rebuilt cheaply.
+    """
+    if os.path.lexists(dest):
+        return
+    try:
+        os.link(src, dest)
+    except OSError:
+        os.symlink(src.resolve(), dest)
+
+
+def link_images(pairs):
+    """Link (src, dest) pairs concurrently; linking is metadata I/O, not CPU"""
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        list(executor.map(lambda pair: link_image(*pair), pairs))
+
+
+def link_tree(src_dir: Path, dest_dir: Path) -> bool:
+    """
+    Hardlink a whole directory with a single `cp -al` (Linux only).
+    
+    Only used for a fresh destination that keeps the source file names.
+    Returns False if cp is unavailable or fails (e.g. across filesystems),
+    in which case the caller links file by file.
+    """
+    if not sys.platform.startswith('linux') or dest_dir.exists():
+        return False
+    dest_dir.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        subprocess.run(['cp', '-al', f'{src_dir}/.', str(dest_dir)], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
 
 def create_binary_dataset(source_data_yaml: str, output_dir: str = "DATA_binary"):
     """
@@ -35,8 +82,7 @@ def create_binary_dataset(source_data_yaml: str, output_dir: str = "DATA_binary"
     print()
     
     # Load original data config
-    with open(source_data_yaml, 'r') as f:
-        config = yaml.safe_load(f)
+    config = load_yaml(str(source_data_yaml))
     
     # Create output directory
     output_path = Path(output_dir)
@@ -53,14 +99,15 @@ def create_binary_dataset(source_data_yaml: str, output_dir: str = "DATA_binary"
             print(f"   ⚠️ Skipping {split} (not found)")
             continue
         
-        # Create output directories
+        # Create output directories (NoDefect is created by link_tree if possible)
         defect_dir = output_path / split / 'Defect'
         no_defect_dir = output_path / split / 'NoDefect'
         defect_dir.mkdir(parents=True, exist_ok=True)
-        no_defect_dir.mkdir(parents=True, exist_ok=True)
         
-        # Copy files
-        defect_count = 0
+        # Collect (source, destination) pairs, then link them in one batch;
+        # scandir's DirEntry.is_file() avoids a stat() per file
+        defect_pairs = []
+        no_defect_pairs = []
         no_defect_count = 0
         
         # Defect classes: Difetto1, Difetto2, Difetto4
@@ -68,20 +115,28 @@ def create_binary_dataset(source_data_yaml: str, output_dir: str = "DATA_binary"
         for defect_class in defect_classes:
             class_dir = source_dir / defect_class
             if class_dir.exists():
-                for img_file in class_dir.glob('*'):
-                    if img_file.is_file():
-                        shutil.copy2(img_file, defect_dir / f"{defect_class}_{img_file.name}")
-                        defect_count += 1
+                with os.scandir(class_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            defect_pairs.append((Path(entry.path), defect_dir / f"{defect_class}_{entry.name}"))
         
-        # No Defect class: NoDifetto
+        # No Defect class: NoDifetto (names are kept, so one cp -al can do it;
+        # defect files are renamed with a class prefix and need the pool)
         no_defect_class_dir = source_dir / 'NoDifetto'
         if no_defect_class_dir.exists():
-            for img_file in no_defect_class_dir.glob('*'):
-                if img_file.is_file():
-                    shutil.copy2(img_file, no_defect_dir / img_file.name)
-                    no_defect_count += 1
+            if link_tree(no_defect_class_dir, no_defect_dir):
+                no_defect_count = len(os.listdir(no_defect_dir))
+            else:
+                with os.scandir(no_defect_class_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            no_defect_pairs.append((Path(entry.path), no_defect_dir / entry.name))
+                no_defect_count = len(no_defect_pairs)
+        no_defect_dir.mkdir(parents=True, exist_ok=True)
+        
+        link_images(defect_pairs + no_defect_pairs)
         
-        print(f"   ✅ {split}: {defect_count} defects, {no_defect_count} no defects")
+        print(f"   ✅ {split}: {len(defect_pairs)} defects, {no_defect_count} no defects")
     
     # Create data.yaml for binary classification
     binary_config = {
@@ -98,7 +153,8 @@ def create_binary_dataset(source_data_yaml: str, output_dir: str = "DATA_binary"
     
     config_path = output_path / 'data.yaml'
     with open(config_path, 'w') as f:
-        yaml.dump(binary_config, f, default_flow_style=False)
+        yaml.dump(binary_config, f, Dumper=SafeDumper, default_flow_style=False)
+    load_yaml.cache_clear()
     
     print(f"\n✅ Binary dataset created: {output_path}")
     print(f"📄 Config saved: {config_path}")
@@ -111,7 +167,9 @@ def train_stage1_binary_detector(
     data_yaml: str,
     model_size: str = 's',
     epochs: int = 50,
-    device: str = '0'
+    device: str = '0',
+    deterministic: bool = False,
+    sync_bn: bool = False
 ):
     """
     Train Stage 1: Binary classifier (Defect vs No Defect)
@@ -129,14 +187,41 @@ def train_stage1_binary_detector(
     print("   Strategy: Very low confidence threshold + high recall focus")
     print()
     
+    # Let cuDNN pick the fastest conv kernels (unless reproducibility was
+    # requested) and allow TF32 for float32 matmuls/convs (AMP below covers
+    # the FP16 tensor-core path)
+    if torch.cuda.is_available():
+        torch.backends.cudnn.benchmark = not deterministic
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+    
+    # Decode images once instead of every epoch
+    cache_mode = choose_cache_mode(data_yaml)
+    
+    # Compile the network (CUDA graphs for the fixed 640x640 shape); the
+    # trainer rebuilds the model, so use its compile option rather than
+    # wrapping model.model. Triton is not available on Windows.
+    compile_mode = 'reduce-overhead' if torch.cuda.is_available() and sys.platform != 'win32' else False
+    
+    # '0,1' trains with DDP: 16 images per GPU, lr0 scaled by sqrt(GPUs)
+    device, num_gpus = parse_devices(device)
+    
     # Load model
-    model = YOLO(f'yolov8{model_size}.pt')
+    model = YOLO(weights_path(model_size))
+    
+    # The trainer rebuilds the network, so switch its model (not ours) to
+    # channels-last once setup is done
+    if torch.cuda.is_available():
+        model.add_callback('on_pretrain_routine_end', to_channels_last)
     
     # Train with HIGH RECALL optimization
     results = model.train(
         data=data_yaml,
         epochs=epochs,
-        batch=16,
+        # Keeps dataloader workers alive and prefetching between epochs
+        # (in every DDP worker too)
+        trainer=patched_trainer(model, sync_bn=sync_bn and num_gpus > 1),
+        batch=16 * num_gpus,  # ultralytics splits the batch across GPUs
         imgsz=640,
         device=device,
         project='models/yolo',
@@ -161,11 +246,11 @@ def train_stage1_binary_detector(
         scale=0.7,
         shear=3.0,
         mixup=0.2,
-        copy_paste=0.3,
+        copy_paste=0.3,  # Needs segment labels; skipped for box-only labels
         
         # Training params
         optimizer='AdamW',
-        lr0=0.001,
+        lr0=0.001 * math.sqrt(num_gpus),
         lrf=0.0001,
         patience=15,
         
@@ -173,6 +258,13 @@ def train_stage1_binary_detector(
         val=True,
         plots=True,
         verbose=True,
+        
+        # Performance
+        workers=min(os.cpu_count(), 12),
+        cache=cache_mode,  # Decoded images in RAM if they fit, else disk
+        amp=True,  # Mixed precision (FP16 autocast)
+        compile=compile_mode,
+        deterministic=deterministic,
     )
     
     print("\n✅ Stage 1 Training Complete!")
@@ -186,13 +278,17 @@ def train_stage2_defect_classifier(
     data_yaml: str,
     model_size: str = 's',
     epochs: int = 50,
-    device: str = '0'
+    device: str = '0',
+    deterministic: bool = False,
+    defect_yaml: str = None,
+    sync_bn: bool = False
 ):
     """
     Train Stage 2: Defect Type Classifier (LP vs PO vs CR)
     
     Only runs on images already classified as defects by Stage 1.
     Can be more precise since it doesn't need to distinguish from No Defect.
+    Pass defect_yaml if the defect-only dataset has already been built.
     """
     
     from ultralytics import YOLO
@@ -206,17 +302,45 @@ def train_stage2_defect_classifier(
     print()
     
     # Create defect-only dataset
-    print("🔨 Creating defect-only dataset...")
-    defect_yaml = create_defect_only_dataset(data_yaml)
+    if defect_yaml is None:
+        print("🔨 Creating defect-only dataset...")
+        defect_yaml = create_defect_only_dataset(data_yaml)
+    
+    # Let cuDNN pick the fastest conv kernels (unless reproducibility was
+    # requested) and allow TF32 for float32 matmuls/convs (AMP below covers
+    # the FP16 tensor-core path)
+    if torch.cuda.is_available():
+        torch.backends.cudnn.benchmark = not deterministic
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+    
+    # Decode images once instead of every epoch
+    cache_mode = choose_cache_mode(defect_yaml)
+    
+    # Compile the network (CUDA graphs for the fixed 640x640 shape); the
+    # trainer rebuilds the model, so use its compile option rather than
+    # wrapping model.model. Triton is not available on Windows.
+    compile_mode = 'reduce-overhead' if torch.cuda.is_available() and sys.platform != 'win32' else False
+    
+    # '0,1' trains with DDP: 16 images per GPU, lr0 scaled by sqrt(GPUs)
+    device, num_gpus = parse_devices(device)
     
     # Load model
-    model = YOLO(f'yolov8{model_size}.pt')
+    model = YOLO(weights_path(model_size))
+    
+    # The trainer rebuilds the network, so switch its model (not ours) to
+    # channels-last once setup is done
+    if torch.cuda.is_available():
+        model.add_callback('on_pretrain_routine_end', to_channels_last)
     
     # Train with precision focus
     results = model.train(
         data=defect_yaml,
         epochs=epochs,
-        batch=16,
+        # Keeps dataloader workers alive and prefetching between epochs
+        # (in every DDP worker too)
+        trainer=patched_trainer(model, sync_bn=sync_bn and num_gpus > 1),
+        batch=16 * num_gpus,  # ultralytics splits the batch across GPUs
         imgsz=640,
         device=device,
         project='models/yolo',
@@ -240,17 +364,24 @@ def train_stage2_defect_classifier(
         translate=0.1,
         scale=0.5,
         mixup=0.1,
-        copy_paste=0.2,
+        copy_paste=0.2,  # Needs segment labels; skipped for box-only labels
         
         # Training params
         optimizer='AdamW',
-        lr0=0.001,
+        lr0=0.001 * math.sqrt(num_gpus),
         lrf=0.001,
         patience=15,
         
         val=True,
         plots=True,
         verbose=True,
+        
+        # Performance
+        workers=min(os.cpu_count(), 12),
+        cache=cache_mode,  # Decoded images in RAM if they fit, else disk
+        amp=True,  # Mixed precision (FP16 autocast)
+        compile=compile_mode,
+        deterministic=deterministic,
     )
     
     print("\n✅ Stage 2 Training Complete!")
@@ -267,30 +398,36 @@ def create_defect_only_dataset(source_data_yaml: str, output_dir: str = "DATA_de
     
     print("📁 Creating defect-only dataset...")
     
-    with open(source_data_yaml, 'r') as f:
-        config = yaml.safe_load(f)
+    config = load_yaml(str(source_data_yaml))
     
     output_path = Path(output_dir)
     output_path.mkdir(exist_ok=True)
     
     splits = ['training', 'validation', 'testing']
+    pairs = []
     
     for split in splits:
         source_dir = Path(config['path']) / split
         if not source_dir.exists():
             continue
         
-        # Copy only defect classes
+        # Link only defect classes
         defect_classes = ['Difetto1', 'Difetto2', 'Difetto4']
         for defect_class in defect_classes:
             class_dir = source_dir / defect_class
             if class_dir.exists():
                 dest_dir = output_path / split / defect_class
+                if link_tree(class_dir, dest_dir):
+                    continue
                 dest_dir.mkdir(parents=True, exist_ok=True)
                 
-                for img_file in class_dir.glob('*'):
-                    if img_file.is_file():
-                        shutil.copy2(img_file, dest_dir / img_file.name)
+                # scandir's DirEntry.is_file() avoids a stat() per file
+                with os.scandir(class_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            pairs.append((Path(entry.path), dest_dir / entry.name))
+    
+    link_images(pairs)
     
     # Create data.yaml
     defect_config = {
@@ -308,7 +445,8 @@ def create_defect_only_dataset(source_data_yaml: str, output_dir: str = "DATA_de
     
     config_path = output_path / 'data.yaml'
     with open(config_path, 'w') as f:
-        yaml.dump(defect_config, f, default_flow_style=False)
+        yaml.dump(defect_config, f, Dumper=SafeDumper, default_flow_style=False)
+    load_yaml.cache_clear()
     
     print(f"✅ Defect-only dataset: {config_path}")
     
@@ -328,9 +466,13 @@ def main():
     parser.add_argument('--epochs', type=int, default=50,
                         help='Epochs per stage')
     parser.add_argument('--device', type=str, default='0',
-                        help='GPU device')
+                        help='GPU device(s), e.g. 0 or 0,1 for multi-GPU DDP')
+    parser.add_argument('--sync-bn', action='store_true',
+                        help='Synchronize BatchNorm statistics across GPUs (multi-GPU only)')
     parser.add_argument('--stage', type=str, choices=['1', '2', 'both'], default='both',
                         help='Which stage to train')
+    parser.add_argument('--deterministic', action='store_true',
+                        help='Reproducible training (disables cuDNN autotuning, slower)')
     
     args = parser.parse_args()
     
@@ -346,6 +488,8 @@ def main():
     print("   • Lower confidence threshold without false positives")
     print()
     
+    defect_prep = None
+    
     if args.stage in ['1', 'both']:
         print("\n" + "▶" * 40)
         print("STARTING STAGE 1: Binary Detector")
@@ -354,12 +498,21 @@ def main():
         # Create binary dataset
         binary_yaml = create_binary_dataset(args.data)
         
+        # Build the Stage 2 dataset (file I/O) while Stage 1 trains on the GPU
+        if args.stage == 'both':
+            defect_prep = multiprocessing.Process(
+                target=create_defect_only_dataset, args=(args.data, "DATA_defects_only")
+            )
+            defect_prep.start()
+        
         # Train Stage 1
         stage1_model = train_stage1_binary_detector(
             data_yaml=binary_yaml,
             model_size=args.model,
             epochs=args.epochs,
-            device=args.device
+            device=args.device,
+            deterministic=args.deterministic,
+            sync_bn=args.sync_bn
         )
     
     if args.stage in ['2', 'both']:
@@ -367,12 +520,23 @@ def main():
         print("STARTING STAGE 2: Defect Classifier")
         print("▶" * 40 + "\n")
         
+        # Wait for the background dataset build; if it failed, Stage 2
+        # rebuilds the dataset itself (existing links are kept)
+        defect_yaml = None
+        if defect_prep is not None:
+            defect_prep.join()
+            if defect_prep.exitcode == 0:
+                defect_yaml = str(Path("DATA_defects_only") / 'data.yaml')
+        
         # Train Stage 2
         stage2_model = train_stage2_defect_classifier(
             data_yaml=args.data,
             model_size=args.model,
             epochs=args.epochs,
-            device=args.device
+            device=args.device,
+            deterministic=args.deterministic,
+            defect_yaml=defect_yaml,
+            sync_bn=args.sync_bn
         )
     
     print("\n" + "=" * 80)
@@ -13,6 +13,10 @@ from pathlib import Path
 import yaml
 from datetime import datetime
 
+# Must be set before torch initializes CUDA; large split blocks reduce the
+# fragmentation that makes AutoBatch-sized runs OOM later in training
+os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'max_split_size_mb:512')
+
 def create_yolo_config(data_dir: str, output_dir: str):
     """Create YOLOv8 data configuration file."""
     
@@ -45,10 +49,11 @@ def train_yolov8(
     model_size: str = 'n',
     data_config: str = 'riawelc.yaml',
     epochs: int = 50,
-    batch_size: int = 16,
+    batch_size: int = -1,
     img_size: int = 640,
     device: str = '0',
-    output_dir: str = 'runs/detect/train'
+    output_dir: str = 'runs/detect/train',
+    amp: bool = True
 ):
     """
     Fine-tune YOLOv8 on RIAWELC dataset.
@@ -57,10 +62,12 @@ def train_yolov8(
         model_size: 'n' (nano), 's' (small), 'm' (medium), 'l' (large), 'x' (xlarge)
         data_config: Path to data YAML file
         epochs: Number of training epochs
-        batch_size: Batch size (16 works well on RTX 4050)
+        batch_size: Batch size, or -1 for AutoBatch (largest batch that fits the GPU)
         img_size: Input image size (640 standard, 1280 for high-res)
         device: GPU device ('0' for first GPU, 'cpu' for CPU)
         output_dir: Output directory for checkpoints and logs
+        amp: Mixed-precision (FP16) training, FP16 validation and a TensorRT
+            FP16 engine export on GPU
     """
     
     try:
@@ -88,10 +95,11 @@ def train_yolov8(
     print(f"   Model: YOLOv8{model_size}")
     print(f"   Dataset: {data_config}")
     print(f"   Epochs: {epochs}")
-    print(f"   Batch Size: {batch_size}")
+    print(f"   Batch Size: {'auto (AutoBatch)' if batch_size == -1 else batch_size}")
     print(f"   Image Size: {img_size}")
     print(f"   Device: {'GPU ' + device if device != 'cpu' else 'CPU'}")
     print(f"   Output: {output_dir}")
+    print(f"   Mixed Precision: {'FP16 (AMP)' if amp else 'FP32'}")
     print()
     
     # Load pre-trained model
@@ -124,6 +132,14 @@ def train_yolov8(
     print("=" * 60)
     print()
     
+    # AutoBatch aims for ~60% of GPU memory; cap the process at 70% so the
+    # chosen batch keeps headroom for validation and allocator fragmentation.
+    # AutoBatch only runs on a single CUDA device ('0', 'cuda:0', ...)
+    if batch_size == -1 and ',' not in device:
+        gpu = torch.device(f'cuda:{device}' if device.isdigit() else device)
+        if gpu.type == 'cuda':
+            torch.cuda.set_per_process_memory_fraction(0.7, gpu.index or 0)
+    
     start_time = datetime.now()
     
     # Train the model
@@ -153,6 +169,7 @@ def train_yolov8(
         plots=True,
         verbose=True,
         resume=False,
+        amp=amp,  # FP16 autocast on tensor cores (ignored on CPU)
     )
     
     end_time = datetime.now()
@@ -169,7 +186,7 @@ def train_yolov8(
     
     # Validate the model
     print("📊 Running validation...")
-    metrics = model.val()
+    metrics = model.val(half=amp and device != 'cpu')
     
     print()
     print("📈 Final Metrics:")
@@ -179,6 +196,16 @@ def train_yolov8(
     print(f"   mAP@0.5:0.95: {metrics.results_dict.get('metrics/mAP50-95(B)', 0):.4f}")
     print()
     
+    # FP16 TensorRT engine for deployment
+    if amp and device != 'cpu':
+        print("📦 Exporting TensorRT FP16 engine...")
+        try:
+            engine_path = model.export(format='engine', half=True, imgsz=img_size, device=device)
+            print(f"✅ Engine saved to: {engine_path}")
+        except Exception as e:
+            print(f"⚠️ TensorRT export failed ({e}); use best.pt instead")
+        print()
+    
     return results
 
 
@@ -191,14 +218,16 @@ def main():
                         help='Path to RIAWELC dataset directory')
     parser.add_argument('--epochs', type=int, default=50,
                         help='Number of training epochs')
-    parser.add_argument('--batch_size', type=int, default=16,
-                        help='Batch size (16 recommended for RTX 4050)')
+    parser.add_argument('--batch_size', type=int, default=-1,
+                        help='Batch size (-1 for AutoBatch, sized to GPU memory)')
     parser.add_argument('--img_size', type=int, default=640,
                         help='Input image size (640 or 1280)')
     parser.add_argument('--device', type=str, default='0',
                         help='GPU device (0, 1, etc.) or cpu')
     parser.add_argument('--output_dir', type=str, default='models/yolo',
                         help='Output directory for checkpoints')
+    parser.add_argument('--amp', action=argparse.BooleanOptionalAction, default=True,
+                        help='Mixed-precision (FP16) training and validation (--no-amp for FP32)')
     
     args = parser.parse_args()
     
@@ -213,7 +242,8 @@ def main():
         batch_size=args.batch_size,
         img_size=args.img_size,
         device=args.device,
-        output_dir=args.output_dir
+        output_dir=args.output_dir,
+        amp=args.amp
     )
 
 
@@ -78,6 +78,20 @@ class TestDefectDetector:
         
         assert len(result_low['boxes']) >= len(result_high['boxes'])
     
+    def test_predict_batch(self, detector, sample_image):
+        """Test batched detection returns one detection list per image."""
+        batch = torch.stack([detector.preprocess_image(sample_image)] * 2)
+        results = detector.predict_batch(batch, confidence_threshold=0.5)
+        
+        assert isinstance(results, list)
+        assert len(results) == 2
+        for detections in results:
+            assert isinstance(detections, list)
+            for det in detections:
+                assert set(det) == {'box', 'score', 'label', 'class_id'}
+                assert len(det['box']) == 4
+                assert det['score'] >= 0.5
+    
     def test_segment(self, detector, sample_image):
         """Test defect segmentation."""
         result = detector.segment(sample_image, confidence_threshold=0.5)
@@ -24,6 +24,7 @@ from core.metrics.business_metrics import (
 )
 from core.metrics.detection_metrics import (
     calculate_map,
+    calculate_map_arrays,
     calculate_auroc,
     calculate_iou
 )
@@ -207,6 +208,41 @@ class TestDetectionMetrics:
         assert isinstance(map_score, float)
         assert 0.0 <= map_score <= 1.0
     
+    def test_calculate_map_arrays(self):
+        """Test array-based mAP matches the dict-based implementation."""
+        predictions = [
+            {
+                'boxes': [[10, 10, 50, 50], [60, 60, 100, 100], [0, 0, 5, 5]],
+                'scores': [0.9, 0.8, 0.7],
+                'labels': [1, 1, 0],
+            }
+        ]
+        
+        ground_truth = [
+            {
+                'boxes': [[12, 12, 48, 48], [65, 65, 95, 95], [1, 1, 5, 5]],
+                'labels': [1, 1, 0],
+            }
+        ]
+        
+        pred_array = np.array([
+            [0, *box, score, label]
+            for box, score, label in zip(
+                predictions[0]['boxes'], predictions[0]['scores'], predictions[0]['labels']
+            )
+        ])
+        gt_array = np.array([
+            [0, *box, label]
+            for box, label in zip(ground_truth[0]['boxes'], ground_truth[0]['labels'])
+        ])
+        
+        map_score = calculate_map_arrays(pred_array, gt_array, iou_threshold=0.5)
+        
+        assert isinstance(map_score, float)
+        assert map_score == pytest.approx(
+            calculate_map(predictions, ground_truth, iou_threshold=0.5)
+        )
+    
     def test_calculate_auroc(self):
         """Test AUROC calculation."""
         scores = np.array([0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.1])